@@ -0,0 +1,58 @@
+"""
+Local stand-in for the Landing AI ADE parse API, for offline ingestion testing
+
+Usage:
+    uvicorn ade_stub:app --port 8002
+    ADE_BASE_URL=http://localhost:8002/v1/tools/agentic-document-analysis python data_ingestion.py
+
+STUB_LATENCY_MS sets the parse time per document. STUB_ERROR_RATE (0-1) is the
+fraction of requests answered with a random 429 or 5xx, to exercise retries,
+and STUB_CHUNKS the number of chunks returned per document.
+"""
+import os
+import random
+import asyncio
+import hashlib
+
+from fastapi import FastAPI, UploadFile, File
+from fastapi.responses import JSONResponse
+
+LATENCY = float(os.getenv("STUB_LATENCY_MS", "1000")) / 1000.0
+ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+CHUNKS = int(os.getenv("STUB_CHUNKS", "10"))
+
+app = FastAPI(title="ADE stub")
+stats = {"requests": 0, "errors": 0}
+
+
+@app.post("/v1/tools/agentic-document-analysis")
+async def parse(pdf: UploadFile = File(...)):
+    stats["requests"] += 1
+    content = await pdf.read()
+
+    if random.random() < ERROR_RATE:
+        stats["errors"] += 1
+        status = random.choice([429, 500, 502, 503])
+        headers = {"Retry-After": "1"} if status == 429 else {}
+        return JSONResponse({"error": "stub failure"}, status_code=status, headers=headers)
+
+    await asyncio.sleep(LATENCY)
+    digest = hashlib.sha1(content).hexdigest()[:8]
+    chunks = [
+        {
+            "text": f"Stub chunk {i} of {pdf.filename} ({digest}).",
+            "chunk_type": "text",
+            "chunk_id": f"{digest}-{i}",
+            "grounding": [{"page": i // 3}]
+        }
+        for i in range(CHUNKS)
+    ]
+    return {
+        "data": {"markdown": "\n\n".join(c["text"] for c in chunks), "chunks": chunks},
+        "errors": []
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
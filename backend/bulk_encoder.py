@@ -0,0 +1,163 @@
+"""
+Multi-process, length-bucketed embedding for index builds
+
+Usage:
+    python bulk_encoder.py [--workers N] [--texts N]
+
+Texts are sorted by length and cut into batches, so each batch pads to a
+similar sequence length (short CSV rows no longer pad up to long ADE table
+chunks). Batches are spread over a pool of worker processes, each holding
+its own model with cores / workers intra-op threads, and the results are
+put back in the original order. The CLI encodes the chunks in
+indexes/all_documents.pkl (or sample sentences) with 1..N workers and prints
+chunks/sec, for sizing build machines.
+"""
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+# Model of the current worker process (see _init_worker)
+_worker_model = None
+
+
+def _init_worker(model_name: str, backend: str, onnx_file: Optional[str], threads: int):
+    global _worker_model
+    from executors import configure_threads
+    from embedding_backend import load_embedding_model
+
+    configure_threads(threads, 1)
+    _worker_model = load_embedding_model(model_name, backend, onnx_file)
+
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    return _worker_model.encode(
+        texts,
+        batch_size=len(texts),
+        convert_to_numpy=True
+    ).astype('float32')
+
+
+def length_batches(texts: List[str], batch_size: int) -> List[np.ndarray]:
+    """
+    Group text positions into batches of similar length
+
+    Returns:
+        Index arrays into texts, longest texts first so the slowest batches
+        start early and the pool drains evenly
+    """
+    lengths = np.fromiter((len(text) for text in texts), dtype='int64', count=len(texts))
+    order = np.argsort(-lengths, kind='stable')
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def padding_efficiency(texts: List[str], batches: List[np.ndarray]) -> float:
+    """Share of padded batch positions holding real text (character lengths as a proxy)"""
+    lengths = np.fromiter((len(text) for text in texts), dtype='int64', count=len(texts))
+    padded = sum(int(lengths[batch].max()) * len(batch) for batch in batches)
+    return float(lengths.sum()) / padded if padded else 1.0
+
+
+class BulkEncoder:
+    """
+    Encodes large text lists across worker processes with length bucketing
+
+    The pool (spawn context, like the render executor) starts on first use
+    and lives until close(); worker start-up loads one model per process,
+    so it only pays off for large inputs.
+    """
+
+    def __init__(self, model_name: str, backend: str = "torch", onnx_file: Optional[str] = None,
+                 workers: int = 0, batch_size: int = 64):
+        cores = os.cpu_count() or 1
+        self.workers = workers if workers > 0 else cores
+        self.threads_per_worker = max(1, cores // self.workers)
+        self.batch_size = max(1, batch_size)
+        self.model_name = model_name
+        self.backend = backend
+        self.onnx_file = onnx_file
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.last_stats: Dict[str, Any] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.backend, self.onnx_file, self.threads_per_worker)
+            )
+        return self._pool
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts in the worker pool
+
+        Returns:
+            float32 array (len(texts), dimension) in the order of texts (not normalized)
+        """
+        start = time.perf_counter()
+        batches = length_batches(texts, self.batch_size)
+        pool = self._get_pool()
+        futures = [pool.submit(_encode_batch, [texts[i] for i in batch]) for batch in batches]
+
+        embeddings = None
+        for batch, future in zip(batches, futures):
+            result = future.result()
+            if embeddings is None:
+                embeddings = np.empty((len(texts), result.shape[1]), dtype='float32')
+            embeddings[batch] = result
+
+        elapsed = time.perf_counter() - start
+        self.last_stats = {
+            "chunks": len(texts),
+            "seconds": elapsed,
+            "chunks_per_sec": len(texts) / elapsed if elapsed > 0 else 0.0,
+            "workers": self.workers,
+            "threads_per_worker": self.threads_per_worker,
+            "padding_efficiency": padding_efficiency(texts, batches)
+        }
+        if embeddings is None:
+            return np.empty((0, 0), dtype='float32')
+        return embeddings
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+if __name__ == "__main__":
+    import pickle
+    from config import EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_ONNX_FILE, INDEX_DIR, BULK_ENCODE_BATCH
+    from embedding_backend import PARITY_TEXTS
+
+    args = sys.argv[1:]
+    max_workers = int(args[args.index("--workers") + 1]) if "--workers" in args else (os.cpu_count() or 1)
+    limit = int(args[args.index("--texts") + 1]) if "--texts" in args else 20000
+
+    documents_path = os.path.join(INDEX_DIR, "all_documents.pkl")
+    if os.path.exists(documents_path):
+        with open(documents_path, 'rb') as f:
+            texts = [doc["text"] for docs in pickle.load(f).values() for doc in docs][:limit]
+    else:
+        texts = (PARITY_TEXTS * (limit // len(PARITY_TEXTS) + 1))[:limit]
+    print(f"Encoding {len(texts)} chunks with {EMBEDDING_MODEL} ({EMBEDDING_BACKEND})")
+
+    workers = 1
+    while workers <= max_workers:
+        encoder = BulkEncoder(EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_ONNX_FILE,
+                              workers=workers, batch_size=BULK_ENCODE_BATCH)
+        # Warm-up pass so model loading is not timed
+        encoder.encode(texts[:workers * BULK_ENCODE_BATCH])
+        encoder.encode(texts)
+        stats = encoder.last_stats
+        encoder.close()
+        print(f"  {workers} workers x {stats['threads_per_worker']} threads: "
+              f"{stats['chunks_per_sec']:.0f} chunks/sec "
+              f"(padding efficiency {stats['padding_efficiency']:.0%})")
+        workers *= 2
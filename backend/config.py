@@ -20,6 +20,36 @@ INDEX_DIR = os.getenv("INDEX_DIR", os.path.join(BASE_DIR, "indexes"))
 if os.path.exists("/app/indexes") and not os.path.exists(INDEX_DIR):
     INDEX_DIR = "/app/indexes"
 
+# Serve indexes and chunk metadata through mmap (read-only, shared page cache
+# across workers). Falls back to the pickled metadata if the serving files
+# have not been written yet.
+INDEX_MMAP = os.getenv("INDEX_MMAP", "true").lower() == "true"
+
+# Default FAISS index settings. A domain can override any key with an
+# "index" entry, e.g.
+#   "index": {"type": "ivf_flat", "nlist": 1024, "nprobe": 16}
+#   "index": {"type": "hnsw", "M": 32, "efConstruction": 200, "efSearch": 64}
+#   "index": {"type": "flat", "storage": "sq8", "rescore_factor": 4}
+# Types: flat (exact), ivf_flat, hnsw
+# Storage: float (1536 B/vector), fp16 (768 B), sq8 (384 B), pq (pq_m bytes).
+# Quantized storage keeps float vectors in a memory-mapped .npy next to the
+# index and re-scores the top k * rescore_factor candidates exactly.
+DEFAULT_INDEX_CONFIG = {
+    "type": os.getenv("INDEX_TYPE", "flat"),
+    "storage": os.getenv("INDEX_STORAGE", "float"),
+    "nlist": 1024,
+    "nprobe": 16,
+    "M": 32,
+    "efConstruction": 200,
+    "efSearch": 64,
+    "pq_m": 48,
+    "pq_nbits": 8,
+    "rescore_factor": 4
+}
+
+# Sample size for the build-time recall@k check of approximate indexes
+RECALL_CHECK_QUERIES = 200
+
 # Clinical domains - Using Clinical folder structure
 DOMAINS = {
     "covid": {
@@ -28,7 +58,10 @@ DOMAINS = {
         "pdf_folder": f"{DATA_DIR}/Clinical/Covid",
         "csv_files": [f"{DATA_DIR}/Clinical/ctg-studies_covid.csv"],
         "index_path": f"{INDEX_DIR}/covid_index.faiss",
-        "metadata_path": f"{INDEX_DIR}/covid_metadata.pkl"
+        "metadata_path": f"{INDEX_DIR}/covid_metadata.pkl",
+        "vectors_path": f"{INDEX_DIR}/covid_vectors.npy",
+        "serving_path": f"{INDEX_DIR}/covid_serving",
+        "sparse_path": f"{INDEX_DIR}/covid_sparse"
     },
     "diabetes": {
         "name": "Diabetes",
@@ -36,7 +69,10 @@ DOMAINS = {
         "pdf_folder": f"{DATA_DIR}/Clinical/Diabetes",
         "csv_files": [f"{DATA_DIR}/Clinical/ctg-studies_diabetes.csv"],
         "index_path": f"{INDEX_DIR}/diabetes_index.faiss",
-        "metadata_path": f"{INDEX_DIR}/diabetes_metadata.pkl"
+        "metadata_path": f"{INDEX_DIR}/diabetes_metadata.pkl",
+        "vectors_path": f"{INDEX_DIR}/diabetes_vectors.npy",
+        "serving_path": f"{INDEX_DIR}/diabetes_serving",
+        "sparse_path": f"{INDEX_DIR}/diabetes_sparse"
     },
     "heart_attack": {
         "name": "Heart Attack",
@@ -44,7 +80,10 @@ DOMAINS = {
         "pdf_folder": f"{DATA_DIR}/Clinical/Heart_attack",
         "csv_files": [f"{DATA_DIR}/Clinical/ctg-studies_Hearattack.csv"],
         "index_path": f"{INDEX_DIR}/heart_attack_index.faiss",
-        "metadata_path": f"{INDEX_DIR}/heart_attack_metadata.pkl"
+        "metadata_path": f"{INDEX_DIR}/heart_attack_metadata.pkl",
+        "vectors_path": f"{INDEX_DIR}/heart_attack_vectors.npy",
+        "serving_path": f"{INDEX_DIR}/heart_attack_serving",
+        "sparse_path": f"{INDEX_DIR}/heart_attack_sparse"
     },
     "knee_injuries": {
         "name": "Knee Injuries",
@@ -52,16 +91,204 @@ DOMAINS = {
         "pdf_folder": f"{DATA_DIR}/Clinical/KneeInjuries",
         "csv_files": [f"{DATA_DIR}/Clinical/ctg-studies_KneeInjuries.csv"],
         "index_path": f"{INDEX_DIR}/knee_injuries_index.faiss",
-        "metadata_path": f"{INDEX_DIR}/knee_injuries_metadata.pkl"
+        "metadata_path": f"{INDEX_DIR}/knee_injuries_metadata.pkl",
+        "vectors_path": f"{INDEX_DIR}/knee_injuries_vectors.npy",
+        "serving_path": f"{INDEX_DIR}/knee_injuries_serving",
+        "sparse_path": f"{INDEX_DIR}/knee_injuries_sparse"
     }
 }
 
+# Combined cross-domain index: all-domain queries become a single search
+# instead of one search per domain plus a Python merge
+MERGED_INDEX_ENABLED = os.getenv("MERGED_INDEX_ENABLED", "false").lower() == "true"
+MERGED_INDEX_PATH = f"{INDEX_DIR}/merged_index.faiss"
+MERGED_METADATA_PATH = f"{INDEX_DIR}/merged_metadata.pkl"
+MERGED_VECTORS_PATH = f"{INDEX_DIR}/merged_vectors.npy"
+
+# Builds write to INDEX_DIR/versions/<timestamp>/ and then mark that version
+# active in INDEX_DIR/CURRENT; a running API switches with POST /admin/reload.
+# Only the newest INDEX_VERSIONS_KEEP versions are kept on disk. With
+# versioning off, builds overwrite the flat paths above.
+INDEX_VERSIONING = os.getenv("INDEX_VERSIONING", "true").lower() == "true"
+INDEX_VERSIONS_KEEP = int(os.getenv("INDEX_VERSIONS_KEEP", "3"))
+
+# Token required in the X-Admin-Token header for /admin endpoints (unset
+# disables the endpoints)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 # Embedding model
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
+# Inference backend for the embedding model: "torch", "onnx" (fp32 ONNX
+# Runtime graph) or "onnx-int8" (dynamically quantized, onnx/model_quint8_avx2.onnx).
+# EMBEDDING_ONNX_FILE overrides the graph file inside the model repository,
+# e.g. onnx/model_qint8_arm64.onnx on ARM hosts. With
+# EMBEDDING_PARITY_CHECK the ONNX embeddings are compared with PyTorch at
+# startup and PyTorch is used if any cosine falls below the threshold.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE") or None
+EMBEDDING_PARITY_CHECK = os.getenv("EMBEDDING_PARITY_CHECK", "false").lower() == "true"
+EMBEDDING_PARITY_THRESHOLD = float(os.getenv("EMBEDDING_PARITY_THRESHOLD", "0.99"))
+
 # Retrieval settings
 TOP_K_RESULTS = 5
 MIN_SIMILARITY_SCORE = 0.3
 
-# OpenRouter settings
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
+# Answer cache for generate_response. "memory" is per process; "sqlite"
+# persists across restarts at RESPONSE_CACHE_PATH
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(INDEX_DIR, "response_cache.sqlite"))
+
+# Number of retrieved chunks passed to the LLM as context
+CONTEXT_CHUNKS = int(os.getenv("CONTEXT_CHUNKS", "5"))
+
+# Context packing: prompt token budget for the chunks, per-chunk cap, and the
+# cosine similarity above which a chunk counts as a near-duplicate of one
+# already selected. Tokens are estimated as characters / CONTEXT_CHARS_PER_TOKEN.
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "2000"))
+CONTEXT_MAX_CHUNK_TOKENS = int(os.getenv("CONTEXT_MAX_CHUNK_TOKENS", "600"))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.95"))
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "4"))
+
+# Optional cross-encoder reranking: retrieve RERANK_CANDIDATES chunks, rerank
+# them within RERANK_BUDGET_MS and keep the best k. When the budget runs out
+# the unscored candidates keep their FAISS order.
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_BATCH_SIZE = 16
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_CACHE_SIZE = 10000
+
+# Hybrid BM25 + dense retrieval. Each retriever contributes up to
+# HYBRID_CANDIDATES hits, combined by reciprocal rank fusion ("rrf") or a
+# weighted sum of cosine and max-normalized BM25 ("weighted")
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "false").lower() == "true"
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf")
+HYBRID_CANDIDATES = 50
+HYBRID_RRF_K = 60
+HYBRID_DENSE_WEIGHT = 0.5
+
+# Micro-batching of concurrent query embeddings: texts arriving within
+# EMBED_BATCH_MAX_WAIT_MS of each other are encoded in one model call
+EMBED_BATCH_ENABLED = os.getenv("EMBED_BATCH_ENABLED", "false").lower() == "true"
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+
+# Maximum number of questions accepted by /query/batch
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "256"))
+# Maximum k (results per question) accepted by /query/batch
+MAX_TOP_K = int(os.getenv("MAX_TOP_K", "50"))
+
+# Query embedding cache (number of distinct queries kept, 0 disables)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+
+# OpenRouter settings (point OPENROUTER_BASE_URL at openrouter_stub.py to test offline)
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Async LLM client: connection pool, keep-alive and in-flight call limit
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "30"))
+
+# CPU-bound stages run on bounded executors so they never block the event
+# loop. Each stage runs at most *_WORKERS tasks and queues at most *_QUEUE
+# more; beyond that requests are rejected with 503 instead of piling up.
+# Rendering uses processes by default because pyplot is not thread-safe.
+# With EMBED_BATCH_ENABLED, retrieval workers spend most of their time
+# waiting on the batcher, so the default pool holds a full embedding batch.
+_DEFAULT_RETRIEVAL_WORKERS = max(2, EMBED_BATCH_MAX_SIZE) if EMBED_BATCH_ENABLED else 2
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", str(_DEFAULT_RETRIEVAL_WORKERS)))
+RETRIEVAL_QUEUE = int(os.getenv("RETRIEVAL_QUEUE", "32"))
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "1"))
+RENDER_QUEUE = int(os.getenv("RENDER_QUEUE", "4"))
+RENDER_EXECUTOR = os.getenv("RENDER_EXECUTOR", "process")  # process or thread
+
+# Intra-op threads per torch (or ONNX Runtime) / FAISS call. Defaults split
+# the cores across the retrieval workers so concurrent searches don't
+# oversubscribe the CPU. With embedding batching and no reranker, only the
+# batcher thread runs the model, so it gets every core.
+_DEFAULT_INTRA_OP_THREADS = max(1, (os.cpu_count() or 1) // max(1, RETRIEVAL_WORKERS))
+_DEFAULT_MODEL_THREADS = (
+    (os.cpu_count() or 1) if EMBED_BATCH_ENABLED and not RERANK_ENABLED else _DEFAULT_INTRA_OP_THREADS
+)
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", str(_DEFAULT_MODEL_THREADS)))
+FAISS_NUM_THREADS = int(os.getenv("FAISS_NUM_THREADS", str(_DEFAULT_INTRA_OP_THREADS)))
+
+# Startup warmup: before /health/ready reports ready, run these queries
+# ("|"-separated) through embedding and search on every loaded domain
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_QUERIES = [q for q in os.getenv(
+    "WARMUP_QUERIES",
+    "What are the symptoms of COVID-19?|"
+    "What are the risk factors for a heart attack?|"
+    "How is diabetes diagnosed?|"
+    "How are ACL injuries treated?"
+).split("|") if q.strip()]
+
+# Landing AI ADE parsing during ingestion. ADE_WORKERS PDFs are parsed in
+# parallel; requests are limited to ADE_RATE_PER_SECOND (token bucket with
+# ADE_RATE_BURST capacity). 429, 5xx, time-outs and connection errors are
+# retried up to ADE_MAX_RETRIES times with exponential backoff (honouring
+# Retry-After). PDFs that still fail are listed in INGEST_FAILURE_REPORT.
+# Point ADE_BASE_URL at ade_stub.py to test offline.
+ADE_BASE_URL = os.getenv("ADE_BASE_URL", "https://api.va.landing.ai/v1/tools/agentic-document-analysis")
+ADE_WORKERS = int(os.getenv("ADE_WORKERS", "4"))
+ADE_RATE_PER_SECOND = float(os.getenv("ADE_RATE_PER_SECOND", "2"))
+ADE_RATE_BURST = int(os.getenv("ADE_RATE_BURST", "4"))
+ADE_CONNECT_TIMEOUT = float(os.getenv("ADE_CONNECT_TIMEOUT", "10"))
+ADE_READ_TIMEOUT = float(os.getenv("ADE_READ_TIMEOUT", "300"))
+ADE_MAX_RETRIES = int(os.getenv("ADE_MAX_RETRIES", "5"))
+ADE_BACKOFF_BASE = float(os.getenv("ADE_BACKOFF_BASE", "1"))
+ADE_BACKOFF_MAX = float(os.getenv("ADE_BACKOFF_MAX", "60"))
+INGEST_FAILURE_REPORT = os.getenv("INGEST_FAILURE_REPORT", os.path.join(INDEX_DIR, "ingest_failures.json"))
+
+# Cache of ADE parse results, keyed by PDF content hash + parse options and
+# stored as gzipped JSON. Re-ingesting unchanged PDFs makes no API calls;
+# delete the directory to force a re-parse.
+ADE_CACHE_ENABLED = os.getenv("ADE_CACHE_ENABLED", "true").lower() == "true"
+ADE_CACHE_DIR = os.getenv("ADE_CACHE_DIR", os.path.join(DATA_DIR, "ade_cache"))
+
+# CSV ingestion reads registry exports in chunks of CSV_CHUNK_ROWS rows, so
+# memory stays bounded on large dumps
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "20000"))
+
+# Streaming index build (python rag_pipeline.py --stream): parsed batches wait
+# in a queue of at most STREAM_PREFETCH_BATCHES, chunks are embedded
+# STREAM_EMBED_BATCH at a time, and the first STREAM_TRAIN_SIZE vectors train
+# IVF/quantized indexes before the rest are added
+STREAM_EMBED_BATCH = int(os.getenv("STREAM_EMBED_BATCH", "256"))
+STREAM_PREFETCH_BATCHES = int(os.getenv("STREAM_PREFETCH_BATCHES", "8"))
+STREAM_TRAIN_SIZE = int(os.getenv("STREAM_TRAIN_SIZE", "50000"))
+
+# Persistent store of chunk embeddings keyed by (model, backend, text hash).
+# Index builds only run the model on chunk texts not seen before, so rebuilds
+# after index or metadata changes take seconds. Delete the directory to reclaim
+# space from texts that are no longer indexed.
+EMBEDDING_STORE_ENABLED = os.getenv("EMBEDDING_STORE_ENABLED", "true").lower() == "true"
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", os.path.join(INDEX_DIR, "embedding_store"))
+
+# Bulk encoding for index builds: at least BULK_ENCODE_MIN_TEXTS new chunks are
+# encoded by BULK_ENCODE_WORKERS processes (0 = one per core; 1 disables the
+# pool) sharing the cores, in length-sorted batches of BULK_ENCODE_BATCH
+BULK_ENCODE_WORKERS = int(os.getenv("BULK_ENCODE_WORKERS", "0"))
+BULK_ENCODE_BATCH = int(os.getenv("BULK_ENCODE_BATCH", "64"))
+BULK_ENCODE_MIN_TEXTS = int(os.getenv("BULK_ENCODE_MIN_TEXTS", "5000"))
+
+# Duplicate chunk removal before indexing (see dedup.py). Exact duplicates
+# (case/whitespace-insensitive) are always dropped when enabled; chunks whose
+# estimated word-shingle Jaccard similarity to an earlier chunk of the same
+# domain is >= DEDUP_NEAR_THRESHOLD are dropped too (1.0 = exact only);
+# structured_data rows (one record per CSV/JSON row) only get exact dedup.
+# DEDUP_NUM_PERM / DEDUP_BANDS tune the MinHash LSH candidate search.
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_NEAR_THRESHOLD = float(os.getenv("DEDUP_NEAR_THRESHOLD", "0.9"))
+DEDUP_SHINGLE_WORDS = int(os.getenv("DEDUP_SHINGLE_WORDS", "3"))
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "128"))
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
@@ -0,0 +1,140 @@
+"""
+Token-aware packing of retrieved chunks into the LLM context
+"""
+import re
+import math
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+# ADE markdown carries anchors like <a id='...'></a> and HTML comments that
+# cost tokens but carry no content
+_MARKUP = re.compile(r"<a\s[^>]*>\s*</a>|<!--.*?-->", re.DOTALL)
+_WHITESPACE = re.compile(r"\s+")
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s")
+
+# Field values in structured rows that add nothing to the answer
+_EMPTY_VALUES = {"", "nan", "none", "null", "n/a", "na", "-"}
+
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    """Approximate LLM token count (the model's tokenizer is not available locally)"""
+    return int(math.ceil(len(text) / chars_per_token))
+
+
+def clean_text(text: str, chunk_type: str = "text") -> str:
+    """
+    Strip low-value text from a chunk
+
+    Removes markup and collapses whitespace; for structured rows
+    ("col: value | col: value") also drops fields with empty values.
+    """
+    text = _MARKUP.sub(" ", text)
+    if chunk_type == "structured_data":
+        fields = []
+        for field in text.split(" | "):
+            _, sep, value = field.partition(":")
+            if sep and value.strip().lower() in _EMPTY_VALUES:
+                continue
+            fields.append(field)
+        text = " | ".join(fields)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def truncate_to_tokens(text: str, max_tokens: int, chars_per_token: float = 4.0) -> str:
+    """Cut text to about max_tokens, preferring a sentence or field boundary"""
+    max_chars = int(max_tokens * chars_per_token)
+    if len(text) <= max_chars:
+        return text
+
+    # Leave room for the ellipsis marker
+    head = text[:max_chars - 2]
+    # Back off to the last boundary if it keeps at least half the allowance
+    cut = max(head.rfind(" | "), *(m.start() for m in _SENTENCE_END.finditer(head)), -1)
+    if cut >= len(head) // 2:
+        head = head[:cut]
+    else:
+        head = head[:head.rfind(" ")] if " " in head else head
+    return head.rstrip(" |") + " …"
+
+
+class ContextPacker:
+    """
+    Select and trim retrieved chunks to fit a prompt token budget
+
+    Chunks are taken in retrieval order. A chunk whose embedding is at least
+    duplicate_threshold cosine-similar to one already selected (or whose
+    cleaned text is identical) is skipped, so the next candidate gets its
+    slot. Each chunk is capped at max_chunk_tokens and the last one is cut to
+    whatever budget remains.
+    """
+
+    def __init__(self, max_tokens: int = 2000, max_chunks: int = 5, max_chunk_tokens: int = 600,
+                 duplicate_threshold: float = 0.95, min_chunk_tokens: int = 32,
+                 chars_per_token: float = 4.0):
+        self.max_tokens = max_tokens
+        self.max_chunks = max_chunks
+        self.max_chunk_tokens = max_chunk_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.min_chunk_tokens = min_chunk_tokens
+        self.chars_per_token = chars_per_token
+
+    def pack(self, docs: List[Dict[str, Any]],
+             vectors: Optional[np.ndarray] = None) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Args:
+            docs: Retrieved documents, best first
+            vectors: L2-normalized embeddings aligned with docs (rows may be
+                all zero when unknown); None disables the similarity check
+
+        Returns:
+            (packed copies of the selected docs with trimmed "text",
+             stats with tokens_before, tokens_after, duplicates, trimmed)
+        """
+        stats = {
+            "tokens_before": sum(
+                estimate_tokens(doc["text"], self.chars_per_token) for doc in docs[:self.max_chunks]
+            ),
+            "tokens_after": 0,
+            "duplicates": 0,
+            "trimmed": 0
+        }
+
+        packed = []
+        selected_rows = []
+        seen_texts = set()
+        remaining = self.max_tokens
+
+        for i, doc in enumerate(docs):
+            if len(packed) >= self.max_chunks or remaining < self.min_chunk_tokens:
+                break
+
+            text = clean_text(doc["text"], doc.get("chunk_type", "text"))
+            if not text:
+                continue
+
+            if text.lower() in seen_texts or self._is_duplicate(vectors, i, selected_rows):
+                stats["duplicates"] += 1
+                continue
+
+            limit = min(self.max_chunk_tokens, remaining)
+            trimmed = truncate_to_tokens(text, limit, self.chars_per_token)
+            # Compared with the cleaned text: cleaning alone is not trimming
+            if trimmed != text:
+                stats["trimmed"] += 1
+
+            tokens = estimate_tokens(trimmed, self.chars_per_token)
+            remaining -= tokens
+            stats["tokens_after"] += tokens
+
+            seen_texts.add(text.lower())
+            selected_rows.append(i)
+            packed.append({**doc, "text": trimmed})
+
+        return packed, stats
+
+    def _is_duplicate(self, vectors: Optional[np.ndarray], row: int, selected_rows: List[int]) -> bool:
+        if vectors is None or not selected_rows or not vectors[row].any():
+            return False
+        similarities = vectors[selected_rows] @ vectors[row]
+        return float(similarities.max()) >= self.duplicate_threshold
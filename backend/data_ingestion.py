@@ -4,127 +4,399 @@ Data ingestion module using Landing AI's Agentic Document Extraction (ADE)
 import os
 import json
 import pickle
+import time
+import random
+import hashlib
+import threading
 import requests
-from typing import List, Dict, Any
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
-from config import VISION_AGENT_API_KEY, DOMAINS
+from config import (
+    VISION_AGENT_API_KEY, DOMAINS, ADE_BASE_URL, ADE_WORKERS, ADE_RATE_PER_SECOND, ADE_RATE_BURST,
+    ADE_CONNECT_TIMEOUT, ADE_READ_TIMEOUT, ADE_MAX_RETRIES, ADE_BACKOFF_BASE, ADE_BACKOFF_MAX,
+    INGEST_FAILURE_REPORT, ADE_CACHE_ENABLED, ADE_CACHE_DIR, CSV_CHUNK_ROWS
+)
+from rate_limiter import TokenBucket
+from parse_cache import ParseCache, cache_key
+
+
+class ADEError(Exception):
+    """ADE request failure, with the HTTP status (None for network errors)"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, attempts: int = 1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.attempts = attempts
 
 
 class LandingAIADE:
     """Wrapper for Landing AI Agentic Document Extraction API"""
     
-    def __init__(self, api_key: str):
+    # Transient statuses worth retrying; other errors fail immediately
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    
+    def __init__(self, api_key: str, base_url: str = ADE_BASE_URL,
+                 rate_limiter: Optional[TokenBucket] = None,
+                 timeout: Tuple[float, float] = (ADE_CONNECT_TIMEOUT, ADE_READ_TIMEOUT),
+                 max_retries: int = ADE_MAX_RETRIES,
+                 backoff_base: float = ADE_BACKOFF_BASE,
+                 backoff_max: float = ADE_BACKOFF_MAX,
+                 cache: Optional[ParseCache] = None):
         self.api_key = api_key
-        self.base_url = "https://api.va.landing.ai/v1/tools/agentic-document-analysis"
+        self.base_url = base_url
+        # Shared by all worker threads so concurrency never exceeds the rate limit
+        self.rate_limiter = rate_limiter or TokenBucket(ADE_RATE_PER_SECOND, ADE_RATE_BURST)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # requests.Session is not thread-safe; keep one per worker thread
+        self._local = threading.local()
+        self.cache = cache
+        self.stats = {"remote_calls": 0, "cache_hits": 0}
+        self._stats_lock = threading.Lock()
+    
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+    
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers["Authorization"] = f"Bearer {self.api_key}"
+            self._local.session = session
+        return session
+    
+    def _backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Seconds to wait before retry number `attempt` (Retry-After wins if sent)"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        # Full jitter keeps parallel workers from retrying in lockstep
+        return random.uniform(0, delay)
     
     def parse(self, document_path: str, include_marginalia: bool = True, 
-              include_metadata_in_markdown: bool = True) -> Dict[str, Any]:
+              include_metadata_in_markdown: bool = True, digest: Optional[str] = None) -> Dict[str, Any]:
         """
         Parse a PDF document using Landing AI ADE
         
+        Results are served from the parse cache when the same file content
+        was already parsed with the same options. Remote calls are rate
+        limited, with a per-request timeout; 429, 5xx and network errors are
+        retried with exponential backoff.
+        
         Args:
             document_path: Path to the PDF file
             include_marginalia: Whether to include headers, footers, etc.
             include_metadata_in_markdown: Whether to include metadata in markdown
+            digest: file_hash of the PDF if the caller already computed it
             
         Returns:
-            Dict containing markdown, chunks, and metadata
+            Dict containing markdown, chunks, and metadata (raises ADEError)
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}"
+        data = {
+            'include_marginalia': str(include_marginalia).lower(),
+            'include_metadata_in_markdown': str(include_metadata_in_markdown).lower(),
+            'enable_rotation_detection': 'false'
         }
         
-        with open(document_path, 'rb') as pdf_file:
-            files = {
-                'pdf': (os.path.basename(document_path), pdf_file, 'application/pdf')
-            }
-            
-            data = {
-                'include_marginalia': str(include_marginalia).lower(),
-                'include_metadata_in_markdown': str(include_metadata_in_markdown).lower(),
-                'enable_rotation_detection': 'false'
-            }
-            
-            response = requests.post(
-                self.base_url,
-                headers=headers,
-                files=files,
-                data=data
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return {
-                    "markdown": result.get("data", {}).get("markdown", ""),
-                    "chunks": result.get("data", {}).get("chunks", []),
-                    "document_url": document_path,
-                    "errors": result.get("errors", [])
-                }
+        key = None
+        if self.cache is not None:
+            # The endpoint is part of the key so stub results never leak into real runs
+            key = cache_key(digest or file_hash(document_path), dict(data, endpoint=self.base_url))
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._count("cache_hits")
+                return dict(cached, document_url=document_path)
+        
+        result = self._parse_remote(document_path, data)
+        if key is not None and not result["errors"]:
+            self.cache.put(key, result)
+        return result
+    
+    def _parse_remote(self, document_path: str, data: Dict[str, str]) -> Dict[str, Any]:
+        """POST one PDF to ADE with rate limiting and retries"""
+        self._count("remote_calls")
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            response = None
+            try:
+                # Reopen per attempt: a failed upload leaves the file position at the end
+                with open(document_path, 'rb') as pdf_file:
+                    files = {
+                        'pdf': (os.path.basename(document_path), pdf_file, 'application/pdf')
+                    }
+                    response = self._session().post(
+                        self.base_url,
+                        files=files,
+                        data=data,
+                        timeout=self.timeout
+                    )
+            except (requests.Timeout, requests.ConnectionError) as e:
+                error = ADEError(f"ADE request failed: {e}", None, attempt + 1)
             else:
-                raise Exception(f"ADE API Error: {response.status_code} - {response.text}")
+                if response.status_code == 200:
+                    result = response.json()
+                    return {
+                        "markdown": result.get("data", {}).get("markdown", ""),
+                        "chunks": result.get("data", {}).get("chunks", []),
+                        "document_url": document_path,
+                        "errors": result.get("errors", [])
+                    }
+                error = ADEError(f"ADE API Error: {response.status_code} - {response.text[:500]}",
+                                 response.status_code, attempt + 1)
+                if response.status_code not in self.RETRY_STATUSES:
+                    raise error
+            
+            if attempt >= self.max_retries:
+                raise error
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def sources_path(documents_path: str) -> str:
+    """Source hash file saved next to a documents pickle"""
+    return os.path.splitext(documents_path)[0] + "_sources.json"
+
+
+def rows_to_text(df: pd.DataFrame) -> List[str]:
+    """
+    Render each row as "col: value | col: value", skipping missing values
+    
+    Values are formatted exactly as the original DataFrame.iterrows() loop
+    saw them: each row is cast to the frame's common dtype, so in an
+    all-numeric frame with a float column an int renders as "63.0". Chunk
+    texts, and with them the embedding store keys, stay unchanged. Built
+    column by column instead of iterating rows in Python.
+    """
+    # to_numpy() applies the same common-dtype cast as iterrows()
+    rows = df.to_numpy()
+    text = np.full(len(df), "", dtype=object)
+    for j, col in enumerate(df.columns):
+        # Boxed like Series item access (e.g. datetime64 -> Timestamp)
+        values = pd.Series(rows[:, j]).astype(object)
+        present = values.notna().to_numpy()
+        if not present.any():
+            continue
+        part = np.full(len(df), "", dtype=object)
+        part[present] = [f"{col}: {value}" for value in values[present]]
+        # Separator only between two present fields
+        sep = np.where(present & (text != ""), " | ", "").astype(object)
+        text = text + sep + part
+    return text.tolist()
 
 
 class DataIngestion:
     """Handles ingestion of PDFs and structured data"""
     
     def __init__(self):
-        self.ade = LandingAIADE(VISION_AGENT_API_KEY)
+        cache = ParseCache(ADE_CACHE_DIR) if ADE_CACHE_ENABLED else None
+        self.ade = LandingAIADE(VISION_AGENT_API_KEY, cache=cache)
         self.all_documents = {}
+        self.failures: List[Dict[str, Any]] = []
+        # domain -> source name -> SHA-256 of the file as it was ingested
+        self.source_hashes: Dict[str, Dict[str, str]] = {}
     
-    def process_pdf_folder(self, domain: str, pdf_folder: str) -> List[Dict[str, Any]]:
+    def process_pdf_folder(self, domain: str, pdf_folder: str,
+                           workers: int = ADE_WORKERS) -> List[Dict[str, Any]]:
         """
         Process all PDFs in a folder for a given domain
         
         Args:
             domain: Clinical domain (covid, diabetes_heart, knee_injuries)
             pdf_folder: Path to folder containing PDFs
+            workers: Number of PDFs parsed concurrently
             
         Returns:
             List of processed documents with chunks
         """
         documents = []
+        for pdf_docs in self.iter_pdf_documents(domain, pdf_folder, workers):
+            documents.extend(pdf_docs)
+        return documents
+    
+    def iter_pdf_documents(self, domain: str, pdf_folder: str,
+                           workers: int = ADE_WORKERS) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Stream the chunk documents of each PDF in a folder
+        
+        PDFs are parsed by `workers` threads sharing the ADE rate limit;
+        files already in the parse cache are not sent to ADE again. At most
+        2 x workers PDFs are in flight, and results are yielded in file name
+        order regardless of completion order. PDFs that still fail after
+        retries are recorded in self.failures.
+        
+        Args:
+            domain: Clinical domain
+            pdf_folder: Path to folder containing PDFs
+            workers: Number of PDFs parsed concurrently
+            
+        Yields:
+            One list of chunk documents per successfully parsed PDF
+        """
         pdf_folder_path = Path(pdf_folder)
         
         if not pdf_folder_path.exists():
             print(f"Warning: PDF folder {pdf_folder} does not exist. Creating it...")
             pdf_folder_path.mkdir(parents=True, exist_ok=True)
-            return documents
+            return
         
-        pdf_files = list(pdf_folder_path.glob("*.pdf"))
+        pdf_files = sorted(pdf_folder_path.glob("*.pdf"))
         
         if not pdf_files:
             print(f"Warning: No PDF files found in {pdf_folder}")
-            return documents
+            return
         
-        print(f"\nProcessing {len(pdf_files)} PDFs for domain: {domain}")
+        workers = max(1, workers)
+        print(f"\nProcessing {len(pdf_files)} PDFs for domain: {domain} ({workers} workers)")
         
-        for pdf_file in pdf_files:
-            try:
-                print(f"  Processing: {pdf_file.name}...")
-                result = self.ade.parse(str(pdf_file))
-                
-                # Extract chunks with metadata
-                for chunk in result["chunks"]:
-                    if chunk.get("text"):
-                        documents.append({
-                            "text": chunk["text"],
-                            "source": pdf_file.name,
-                            "domain": domain,
-                            "page": chunk.get("grounding", [{}])[0].get("page", 0) if chunk.get("grounding") else 0,
-                            "chunk_type": chunk.get("chunk_type", "text"),
-                            "chunk_id": chunk.get("chunk_id", ""),
-                            "grounding": chunk.get("grounding", [])
-                        })
-                
-                print(f"    Extracted {len([c for c in result['chunks'] if c.get('text')])} chunks")
-                
-            except Exception as e:
-                print(f"    Error processing {pdf_file.name}: {str(e)}")
+        remote_before = self.ade.stats["remote_calls"]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            remaining = iter(pdf_files)
+            for pdf_file in islice(remaining, 2 * workers):
+                pending.append((pdf_file, executor.submit(self.process_pdf, domain, str(pdf_file))))
+            
+            while pending:
+                pdf_file, future = pending.popleft()
+                # Keep the window full while the caller consumes this result
+                for next_file in islice(remaining, 1):
+                    pending.append((next_file, executor.submit(self.process_pdf, domain, str(next_file))))
+                try:
+                    pdf_docs = future.result()
+                except Exception as e:
+                    print(f"  Error processing {pdf_file.name}: {str(e)}")
+                    self.record_failure(domain, str(pdf_file), e)
+                    continue
+                print(f"  {pdf_file.name}: extracted {len(pdf_docs)} chunks")
+                yield pdf_docs
+        
+        remote_calls = self.ade.stats["remote_calls"] - remote_before
+        print(f"  Parsed {remote_calls} PDFs with ADE, {len(pdf_files) - remote_calls} unchanged (from cache)")
+    
+    def iter_domain_documents(self, domain: str) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Stream every document of a domain (PDFs, then CSV/JSON files) in batches
         
+        Same documents, in the same order, as ingest_all_domains produces for
+        the domain, without holding them all in memory.
+        """
+        domain_config = DOMAINS[domain]
+        yield from self.iter_pdf_documents(domain, domain_config["pdf_folder"])
+        for file_path in domain_config.get("csv_files", []):
+            yield from self.iter_csv_documents(domain, file_path)
+    
+    def record_source(self, domain: str, path: str, digest: str):
+        """Remember the hash of a parsed source, with or without chunks (for sources.json)"""
+        self.source_hashes.setdefault(domain, {})[os.path.basename(path)] = digest
+    
+    def record_failure(self, domain: str, path: str, error: Exception):
+        """Remember a source that could not be parsed, for the failure report"""
+        self.failures.append({
+            "domain": domain,
+            "source": os.path.basename(path),
+            "path": path,
+            "error": str(error),
+            "status_code": getattr(error, "status_code", None),
+            "attempts": getattr(error, "attempts", 1),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+        })
+    
+    def write_failure_report(self, output_path: str = INGEST_FAILURE_REPORT):
+        """
+        Write the sources that failed this run as JSON
+        
+        retry_failed_pdfs.py reads this file; an empty list means everything
+        was ingested.
+        """
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, 'w') as f:
+            json.dump({"failures": self.failures}, f, indent=2)
+        if self.failures:
+            print(f"\n{len(self.failures)} sources failed, see {output_path}")
+    
+    def process_pdf(self, domain: str, pdf_path: str) -> List[Dict[str, Any]]:
+        """
+        Parse one PDF with ADE into chunk documents
+        
+        Args:
+            domain: Clinical domain
+            pdf_path: Path to the PDF
+            
+        Returns:
+            List of chunk documents (raises on ADE errors)
+        """
+        # Hashed once, before parsing: the digest also keys the parse cache, and
+        # a file edited mid-run is picked up by the next update
+        digest = file_hash(pdf_path)
+        result = self.ade.parse(pdf_path, digest=digest)
+        source = os.path.basename(pdf_path)
+        
+        # Extract chunks with metadata
+        documents = []
+        for chunk in result["chunks"]:
+            if chunk.get("text"):
+                documents.append({
+                    "text": chunk["text"],
+                    "source": source,
+                    "domain": domain,
+                    "page": chunk.get("grounding", [{}])[0].get("page", 0) if chunk.get("grounding") else 0,
+                    "chunk_type": chunk.get("chunk_type", "text"),
+                    "chunk_id": chunk.get("chunk_id", ""),
+                    "grounding": chunk.get("grounding", [])
+                })
+        self.record_source(domain, pdf_path, digest)
         return documents
     
+    def list_sources(self, domain: str) -> Dict[str, str]:
+        """
+        Source files currently on disk for a domain
+        
+        Returns:
+            Dictionary mapping source name (as stored in chunk "source") to path
+        """
+        domain_config = DOMAINS[domain]
+        sources = {}
+        
+        pdf_folder = Path(domain_config["pdf_folder"])
+        if pdf_folder.exists():
+            for pdf_file in sorted(pdf_folder.glob("*.pdf")):
+                sources[pdf_file.name] = str(pdf_file)
+        
+        for file_path in domain_config.get("csv_files", []):
+            if os.path.exists(file_path):
+                sources[os.path.basename(file_path)] = file_path
+        
+        return sources
+    
+    def process_source(self, domain: str, path: str) -> List[Dict[str, Any]]:
+        """Parse one source file (PDF, CSV or JSON) into chunk documents"""
+        if path.endswith('.pdf'):
+            return self.process_pdf(domain, path)
+        return self.process_csv_files(domain, [path])
+    
     def process_csv_files(self, domain: str, csv_files: List[str]) -> List[Dict[str, Any]]:
         """
         Process CSV/JSON files containing semi-structured clinical data
@@ -139,34 +411,48 @@ class DataIngestion:
         documents = []
         
         for file_path in csv_files:
-            file_path_obj = Path(file_path)
+            for batch in self.iter_csv_documents(domain, file_path):
+                documents.extend(batch)
+        
+        return documents
+    
+    def iter_csv_documents(self, domain: str, file_path: str,
+                           chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Stream one CSV/JSON file as batches of row documents
+        
+        CSVs are read `chunk_rows` rows at a time, so memory is bounded by
+        the chunk size rather than the file size.
+        
+        Args:
+            domain: Clinical domain
+            file_path: CSV or JSON file
+            chunk_rows: Rows per batch
             
-            if not file_path_obj.exists():
-                print(f"Warning: File {file_path} does not exist")
-                continue
+        Yields:
+            Lists of documents, one per row, in file order
+        """
+        file_path_obj = Path(file_path)
+        
+        if not file_path_obj.exists():
+            print(f"Warning: File {file_path} does not exist")
+            return
+        
+        try:
+            digest = file_hash(file_path)
+            if file_path.endswith('.csv'):
+                chunks = pd.read_csv(file_path, chunksize=chunk_rows)
+            elif file_path.endswith('.json'):
+                chunks = [pd.read_json(file_path)]
+            else:
+                print(f"Unsupported file format: {file_path}")
+                return
             
-            try:
-                # Read CSV or JSON
-                if file_path.endswith('.csv'):
-                    df = pd.read_csv(file_path)
-                elif file_path.endswith('.json'):
-                    df = pd.read_json(file_path)
-                else:
-                    print(f"Unsupported file format: {file_path}")
-                    continue
-                
-                # Convert each row to a text document
-                for idx, row in df.iterrows():
-                    # Create a textual representation of the row
-                    text_parts = []
-                    for col in df.columns:
-                        value = row[col]
-                        if pd.notna(value):
-                            text_parts.append(f"{col}: {value}")
-                    
-                    text = " | ".join(text_parts)
-                    
-                    documents.append({
+            rows = 0
+            for df in chunks:
+                texts = rows_to_text(df)
+                yield [
+                    {
                         "text": text,
                         "source": file_path_obj.name,
                         "domain": domain,
@@ -174,14 +460,16 @@ class DataIngestion:
                         "chunk_type": "structured_data",
                         "chunk_id": f"row_{idx}",
                         "grounding": []
-                    })
-                
-                print(f"Processed {len(df)} rows from {file_path_obj.name}")
-                
-            except Exception as e:
-                print(f"Error processing {file_path}: {str(e)}")
-        
-        return documents
+                    }
+                    for idx, text in zip(df.index, texts)
+                ]
+                rows += len(df)
+            
+            self.record_source(domain, file_path, digest)
+            print(f"Processed {rows} rows from {file_path_obj.name}")
+            
+        except Exception as e:
+            print(f"Error processing {file_path}: {str(e)}")
     
     def ingest_all_domains(self) -> Dict[str, List[Dict[str, Any]]]:
         """
@@ -191,6 +479,8 @@ class DataIngestion:
             Dictionary mapping domain to list of documents
         """
         all_docs = {}
+        self.failures = []
+        self.source_hashes = {}
         
         for domain_key, domain_config in DOMAINS.items():
             print(f"\n{'='*60}")
@@ -214,19 +504,26 @@ class DataIngestion:
             print(f"\nTotal documents for {domain_key}: {len(documents)}")
         
         self.all_documents = all_docs
+        self.write_failure_report()
         return all_docs
     
     def save_documents(self, output_path: str = "indexes/all_documents.pkl"):
-        """Save processed documents to disk"""
+        """Save processed documents (and their source hashes) to disk"""
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         with open(output_path, 'wb') as f:
             pickle.dump(self.all_documents, f)
+        with open(sources_path(output_path), 'w') as f:
+            json.dump(self.source_hashes, f, indent=1, sort_keys=True)
         print(f"\nSaved all documents to {output_path}")
     
     def load_documents(self, input_path: str = "indexes/all_documents.pkl") -> Dict[str, List[Dict[str, Any]]]:
-        """Load processed documents from disk"""
+        """Load processed documents (and source hashes, if saved) from disk"""
         with open(input_path, 'rb') as f:
             self.all_documents = pickle.load(f)
+        self.source_hashes = {}
+        if os.path.exists(sources_path(input_path)):
+            with open(sources_path(input_path)) as f:
+                self.source_hashes = json.load(f)
         return self.all_documents
 
 
@@ -0,0 +1,143 @@
+"""
+Duplicate and near-duplicate chunk removal before indexing
+
+ADE output repeats page headers, footers and other marginalia on every
+page, and registry CSVs contain repeated rows. Chunks are filtered in
+document order, keeping the first occurrence:
+
+- exact: same text after lowercasing and collapsing whitespace
+- near: estimated Jaccard similarity of word shingles >= threshold, found
+  with MinHash signatures and LSH banding, so each chunk is only compared
+  with the few kept chunks that share a band bucket
+
+Structured rows (chunk_type "structured_data") only get the exact check:
+two trial records differing in a single field share most of their
+shingles but are distinct records.
+
+The filter is incremental, so the streaming build can apply it batch by
+batch with the same result as filtering the whole list, and incremental
+index updates can seed it with the chunks already indexed.
+"""
+import re
+import zlib
+import hashlib
+from typing import List, Dict, Any, Iterable
+
+import numpy as np
+
+# Mersenne prime for the universal hash family (a * x + b) mod P
+_PRIME = (1 << 61) - 1
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def shingles(text: str, size: int) -> List[str]:
+    """Word n-grams of a text (the whole text as one shingle if shorter than size)"""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return [" ".join(words)]
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+class DuplicateFilter:
+    """
+    Drops exact and near-duplicate chunks, keeping the first occurrence
+
+    Args:
+        threshold: Minimum estimated Jaccard similarity to count as a near
+            duplicate (>= 1.0 disables near-duplicate detection)
+        shingle_words: Words per shingle
+        num_perm: MinHash signature length
+        bands: LSH bands (num_perm must be divisible by it); more bands
+            find more candidate pairs at lower similarity
+        seed: Seed of the hash family, fixed so builds are reproducible
+    """
+
+    def __init__(self, threshold: float = 0.9, shingle_words: int = 3,
+                 num_perm: int = 128, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self.threshold = threshold
+        self.shingle_words = shingle_words
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=(num_perm, 1), dtype=np.uint64)
+
+        self._exact = set()
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self._signatures: List[np.ndarray] = []
+        self.stats = {"input": 0, "exact": 0, "near": 0, "kept": 0}
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature (num_perm uint64 values) of a text's shingles"""
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode('utf-8')) for s in set(shingles(text, self.shingle_words))),
+            dtype=np.uint64
+        )
+        # a, b, x < 2^32, so a * x + b cannot overflow uint64
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1)
+
+    def _is_near_duplicate(self, signature: np.ndarray) -> bool:
+        candidates = set()
+        for band in range(self.bands):
+            key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            candidates.update(self._buckets[band].get(key, ()))
+        if not candidates:
+            return False
+        kept = np.stack([self._signatures[c] for c in candidates])
+        similarity = (kept == signature).mean(axis=1)
+        return bool(similarity.max() >= self.threshold)
+
+    def _remember(self, signature: np.ndarray):
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        for band in range(self.bands):
+            key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            self._buckets[band].setdefault(key, []).append(position)
+
+    def _checks_near(self, doc: Dict[str, Any]) -> bool:
+        return self.threshold < 1.0 and doc.get("chunk_type") != "structured_data"
+
+    def seed(self, documents: Iterable[Dict[str, Any]]):
+        """Remember already kept documents (e.g. an existing index) without counting them"""
+        for doc in documents:
+            text = normalize_text(doc["text"])
+            self._exact.add(hashlib.sha1(text.encode('utf-8')).digest())
+            if self._checks_near(doc):
+                self._remember(self.signature(text))
+
+    def filter(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Documents not duplicating an earlier one (from this or previous calls)"""
+        kept = []
+        for doc in documents:
+            self.stats["input"] += 1
+            text = normalize_text(doc["text"])
+            digest = hashlib.sha1(text.encode('utf-8')).digest()
+            if digest in self._exact:
+                self.stats["exact"] += 1
+                continue
+            self._exact.add(digest)
+
+            if self._checks_near(doc):
+                signature = self.signature(text)
+                if self._is_near_duplicate(signature):
+                    self.stats["near"] += 1
+                    continue
+                self._remember(signature)
+
+            kept.append(doc)
+            self.stats["kept"] += 1
+        return kept
+
+    def report(self) -> Dict[str, Any]:
+        """Counts plus the fraction of input chunks removed"""
+        stats = dict(self.stats)
+        stats["reduction"] = 1.0 - stats["kept"] / stats["input"] if stats["input"] else 0.0
+        return stats
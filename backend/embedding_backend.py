@@ -0,0 +1,152 @@
+"""
+Embedding model loading with selectable inference backend (PyTorch or ONNX Runtime)
+
+Usage:
+    python embedding_backend.py [onnx|onnx-int8] [--texts N]
+
+Encodes sample clinical sentences with PyTorch and with the chosen backend,
+prints the encode speedup and fails if any cosine similarity between the
+two falls below EMBEDDING_PARITY_THRESHOLD.
+"""
+import sys
+import time
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+# Pre-exported graphs shipped in the all-MiniLM-L6-v2 repository. The int8
+# default is the AVX2 build (unsigned int8), which every x86 server we run
+# has; the repository also ships model_qint8_avx512.onnx,
+# model_qint8_avx512_vnni.onnx and model_qint8_arm64.onnx, selectable with
+# EMBEDDING_ONNX_FILE.
+ONNX_FILES = {
+    "onnx": "onnx/model.onnx",
+    "onnx-int8": "onnx/model_quint8_avx2.onnx"
+}
+
+# Intra-op threads of the ONNX Runtime sessions created by
+# load_embedding_model (0 = ONNX Runtime default, one per core). Set through
+# executors.configure_threads together with the torch and FAISS limits.
+_onnx_threads = 0
+
+PARITY_TEXTS = [
+    "What are the common symptoms of COVID-19 in older adults?",
+    "Patients with type 2 diabetes have an increased risk of myocardial infarction.",
+    "ACL tears are usually diagnosed with MRI after a pivoting knee injury.",
+    "Chest pain radiating to the left arm can indicate a heart attack.",
+    "Blood glucose levels above 200 mg/dL two hours after eating suggest diabetes.",
+    "Remdesivir shortened time to recovery in hospitalized COVID-19 patients.",
+    "Meniscus injuries often present with locking or catching of the knee.",
+    "age: 63 | sex: 1 | cp: 3 | trestbps: 145 | chol: 233 | fbs: 1 | target: 1",
+    "Pregnancies: 6 | Glucose: 148 | BloodPressure: 72 | BMI: 33.6 | Outcome: 1",
+    "Physical therapy is recommended before surgical reconstruction in many cases.",
+    "Elevated troponin is a marker of cardiac muscle damage.",
+    "Loss of taste and smell was reported by many patients during the pandemic."
+]
+
+
+def set_onnx_threads(threads: int):
+    """Cap intra-op threads of ONNX sessions loaded from now on (0 = no cap)"""
+    global _onnx_threads
+    _onnx_threads = max(0, threads)
+
+
+def load_embedding_model(model_name: str, backend: str = "torch",
+                         onnx_file: Optional[str] = None) -> SentenceTransformer:
+    """
+    Load a SentenceTransformer on the requested backend
+
+    Args:
+        model_name: Hugging Face model id or local path
+        backend: "torch", "onnx" (fp32 graph) or "onnx-int8" (dynamically quantized)
+        onnx_file: Override the ONNX file inside the model repository
+
+    Returns:
+        SentenceTransformer with the same encode() interface for every backend
+    """
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if backend in ONNX_FILES:
+        model_kwargs = {"file_name": onnx_file or ONNX_FILES[backend]}
+        if _onnx_threads:
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = _onnx_threads
+            options.inter_op_num_threads = 1
+            model_kwargs["session_options"] = options
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+    raise ValueError(f"Unknown embedding backend '{backend}'. Valid backends: {['torch'] + list(ONNX_FILES)}")
+
+
+def _encode(model: SentenceTransformer, texts: List[str]) -> np.ndarray:
+    embeddings = model.encode(texts, convert_to_numpy=True).astype('float32')
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def check_parity(model: SentenceTransformer, reference: SentenceTransformer,
+                 texts: List[str], threshold: float) -> Dict[str, Any]:
+    """
+    Compare a model's embeddings with the reference (PyTorch) embeddings
+
+    Returns:
+        Dictionary with min/mean cosine similarity, per-model encode time and
+        "passed" (min cosine >= threshold)
+    """
+    # Warm up both models so graph/session setup is not timed
+    _encode(reference, texts[:2])
+    _encode(model, texts[:2])
+
+    start = time.perf_counter()
+    expected = _encode(reference, texts)
+    reference_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = _encode(model, texts)
+    model_seconds = time.perf_counter() - start
+
+    cosines = np.sum(expected * actual, axis=1)
+    return {
+        "texts": len(texts),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "threshold": threshold,
+        "passed": bool(cosines.min() >= threshold),
+        "reference_seconds": reference_seconds,
+        "model_seconds": model_seconds,
+        "speedup": reference_seconds / model_seconds if model_seconds > 0 else float("inf")
+    }
+
+
+if __name__ == "__main__":
+    from config import EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_ONNX_FILE, EMBEDDING_PARITY_THRESHOLD
+
+    args = sys.argv[1:]
+    backend = EMBEDDING_BACKEND if EMBEDDING_BACKEND != "torch" else "onnx-int8"
+    num_texts = 512
+    if "--texts" in args:
+        pos = args.index("--texts")
+        num_texts = int(args[pos + 1])
+        del args[pos:pos + 2]
+    if args:
+        backend = args[0]
+
+    print("\n" + "="*60)
+    print(f"Embedding parity check: torch vs {backend}")
+    print("="*60)
+
+    reference = load_embedding_model(EMBEDDING_MODEL, "torch")
+    model = load_embedding_model(EMBEDDING_MODEL, backend, EMBEDDING_ONNX_FILE)
+    texts = (PARITY_TEXTS * (num_texts // len(PARITY_TEXTS) + 1))[:num_texts]
+
+    result = check_parity(model, reference, texts, EMBEDDING_PARITY_THRESHOLD)
+
+    print(f"  Texts: {result['texts']}")
+    print(f"  Cosine similarity: min {result['min_cosine']:.5f}, mean {result['mean_cosine']:.5f} "
+          f"(threshold {result['threshold']})")
+    print(f"  Encode time: torch {result['reference_seconds']:.2f}s, "
+          f"{backend} {result['model_seconds']:.2f}s ({result['speedup']:.2f}x)")
+    print(f"  Parity: {'PASSED' if result['passed'] else 'FAILED'}")
+
+    sys.exit(0 if result["passed"] else 1)
@@ -0,0 +1,129 @@
+"""
+Persistent store of chunk embeddings keyed by (model, chunk text hash)
+
+Layout under EMBEDDING_STORE_DIR, one directory per model and backend:
+
+    <model>__<backend>/meta.json    dimension and dtype
+    <model>__<backend>/keys.bin     20-byte SHA-1 of each chunk's text, row order
+    <model>__<backend>/vectors.bin  float32 (rows, dimension), same row order
+
+Both files are append-only. Vectors are written before their keys, so a
+build interrupted mid-append leaves at most some unreferenced vector bytes,
+which are truncated on the next open. Rows are read through a read-only
+memory map, so a store much larger than RAM costs only the pages touched.
+One build should write to a store at a time.
+"""
+import os
+import re
+import json
+from typing import List, Dict, Tuple
+
+import numpy as np
+
+KEY_BYTES = 20
+
+
+class EmbeddingStore:
+    """Append-only embedding matrix with a hash -> row index"""
+
+    def __init__(self, root: str, model_name: str, backend: str, dimension: int):
+        # Backends produce slightly different vectors (e.g. int8), so each gets its own store
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{model_name}__{backend}")
+        self.directory = os.path.join(root, name)
+        self.dimension = dimension
+        self.row_bytes = dimension * 4
+        self._keys_path = os.path.join(self.directory, "keys.bin")
+        self._vectors_path = os.path.join(self.directory, "vectors.bin")
+        self._rows: Dict[bytes, int] = {}
+        self._matrix = None
+        self._open()
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path = os.path.join(self.directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["dimension"] != self.dimension:
+                raise ValueError(
+                    f"Embedding store {self.directory} has dimension {meta['dimension']}, "
+                    f"expected {self.dimension}"
+                )
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump({"dimension": self.dimension, "dtype": "float32"}, f)
+
+        keys = b""
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path, 'rb') as f:
+                keys = f.read()
+        vector_rows = 0
+        if os.path.exists(self._vectors_path):
+            vector_rows = os.path.getsize(self._vectors_path) // self.row_bytes
+
+        rows = min(len(keys) // KEY_BYTES, vector_rows)
+        # Drop a torn tail left by an interrupted append
+        for path, size in ((self._keys_path, rows * KEY_BYTES), (self._vectors_path, rows * self.row_bytes)):
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+
+        self._rows = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(rows)}
+        self._matrix = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _vectors(self) -> np.ndarray:
+        if self._matrix is None or len(self._matrix) != len(self._rows):
+            self._matrix = np.memmap(self._vectors_path, dtype='float32', mode='r',
+                                     shape=(len(self._rows), self.dimension))
+        return self._matrix
+
+    def lookup(self, hashes: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Fetch stored vectors
+
+        Args:
+            hashes: Hex SHA-1 of each text (index_store.text_hash)
+
+        Returns:
+            (vectors, missing): float32 (len(hashes), dimension) with found
+            rows filled in, and the positions that were not in the store
+        """
+        vectors = np.empty((len(hashes), self.dimension), dtype='float32')
+        found_pos, found_rows, missing = [], [], []
+        for i, digest in enumerate(hashes):
+            row = self._rows.get(bytes.fromhex(digest))
+            if row is None:
+                missing.append(i)
+            else:
+                found_pos.append(i)
+                found_rows.append(row)
+        if found_rows:
+            # Sorted reads keep memmap access sequential
+            order = np.argsort(found_rows)
+            rows = np.asarray(found_rows)[order]
+            vectors[np.asarray(found_pos)[order]] = self._vectors()[rows]
+        return vectors, missing
+
+    def add(self, hashes: List[str], vectors: np.ndarray):
+        """Append vectors for texts not yet stored (duplicates are skipped)"""
+        new_keys, new_rows, seen = [], [], set()
+        for i, digest in enumerate(hashes):
+            key = bytes.fromhex(digest)
+            if key not in self._rows and key not in seen:
+                seen.add(key)
+                new_keys.append(key)
+                new_rows.append(i)
+        if not new_keys:
+            return
+        with open(self._vectors_path, 'ab') as f:
+            f.write(np.ascontiguousarray(vectors[new_rows], dtype='float32').tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self._keys_path, 'ab') as f:
+            f.write(b"".join(new_keys))
+        start = len(self._rows)
+        for offset, key in enumerate(new_keys):
+            self._rows[key] = start + offset
@@ -0,0 +1,121 @@
+"""
+Bounded executors that keep CPU-bound stages off the event loop
+"""
+import asyncio
+import threading
+import multiprocessing
+from functools import partial
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Dict, Any, Optional
+
+
+class StageOverloaded(Exception):
+    """Raised when a stage already has max_workers running and max_queue waiting"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"{stage} stage is at capacity")
+        self.stage = stage
+
+
+class BoundedExecutor:
+    """
+    Thread or process pool with a per-stage admission limit
+
+    At most max_workers tasks run at once and at most max_queue more wait;
+    further submissions fail fast with StageOverloaded instead of piling up
+    behind a slow stage.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, kind: str = "thread"):
+        self.name = name
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._pool: Executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        # Metrics
+        self.completed = 0
+        self.rejected = 0
+
+    def _ensure_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                # spawn avoids forking a parent that already runs torch/OpenMP threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            elif self.kind == "thread":
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=f"{self.name}-worker"
+                )
+            else:
+                raise ValueError(f"Unknown executor kind '{self.kind}'. Valid kinds: ['thread', 'process']")
+        return self._pool
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on the pool and await its result
+
+        The admission slot is released when the job itself finishes, not
+        when the caller stops waiting: a cancelled request (e.g. a client
+        disconnect) cannot stop a job that already started, so it keeps
+        counting against the bound until it is done.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise StageOverloaded(self.name)
+            self._pending += 1
+
+        try:
+            future = self._ensure_pool().submit(partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future: Optional[Future]):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Occupancy figures for the health endpoint"""
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._pending,
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
+
+
+def configure_threads(torch_threads: int, faiss_threads: int):
+    """
+    Cap intra-op parallelism so concurrent requests don't oversubscribe cores
+
+    With N retrieval workers each running torch and FAISS, the per-call
+    thread counts should be about cores / N. ONNX Runtime sessions keep
+    their own thread pool, so torch_threads is also applied to ONNX
+    embedding models loaded after this call.
+    """
+    import torch
+    import faiss
+    from embedding_backend import set_onnx_threads
+
+    torch.set_num_threads(max(1, torch_threads))
+    faiss.omp_set_num_threads(max(1, faiss_threads))
+    set_onnx_threads(max(1, torch_threads))
+
@@ -0,0 +1,250 @@
+"""
+FAISS index construction: exact and approximate index types per domain
+"""
+from typing import Dict, Any, Optional, Callable, Tuple
+
+import numpy as np
+import faiss
+
+from config import DEFAULT_INDEX_CONFIG, DOMAINS
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw")
+STORAGE_TYPES = ("float", "fp16", "sq8", "pq")
+
+# FAISS warns below ~39 training points per IVF list
+MIN_POINTS_PER_CENTROID = 39
+
+
+def get_index_config(domain: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Resolve the index settings for a domain
+
+    Domain entries in DOMAINS may carry an "index" dict that overrides
+    DEFAULT_INDEX_CONFIG key by key.
+    """
+    index_config = dict(DEFAULT_INDEX_CONFIG)
+    if domain in DOMAINS:
+        index_config.update(DOMAINS[domain].get("index", {}))
+
+    if index_config["type"] not in INDEX_TYPES:
+        raise ValueError(
+            f"Unknown index type '{index_config['type']}' for {domain}. "
+            f"Valid types: {list(INDEX_TYPES)}"
+        )
+    return index_config
+
+
+def factory_string(index_config: Dict[str, Any], nlist: Optional[int] = None) -> str:
+    """
+    Translate index settings into a faiss.index_factory description
+
+    e.g. flat/float -> "Flat", ivf_flat/sq8 -> "IVF1024,SQ8", hnsw/pq -> "HNSW32,PQ48"
+    """
+    storage = index_config.get("storage", "float")
+    if storage not in STORAGE_TYPES:
+        raise ValueError(
+            f"Unknown vector storage '{storage}'. Valid storage: {list(STORAGE_TYPES)}"
+        )
+
+    encoding = {
+        "float": "Flat",
+        "fp16": "SQfp16",
+        "sq8": "SQ8",
+        "pq": f"PQ{int(index_config.get('pq_m', 48))}x{int(index_config.get('pq_nbits', 8))}"
+    }[storage]
+
+    index_type = index_config["type"]
+    if index_type == "ivf_flat":
+        return f"IVF{nlist or int(index_config.get('nlist', 1024))},{encoding}"
+    if index_type == "hnsw":
+        return f"HNSW{int(index_config.get('M', 32))},{encoding}"
+    return encoding
+
+
+def is_quantized(index_config: Dict[str, Any]) -> bool:
+    """Whether the index stores lossy codes that need exact re-scoring"""
+    return index_config.get("storage", "float") != "float"
+
+
+def create_index(embeddings: np.ndarray, index_config: Dict[str, Any]) -> faiss.Index:
+    """
+    Create, train and fill an inner-product index
+
+    Args:
+        embeddings: L2-normalized float32 matrix (n, dimension)
+        index_config: Settings from get_index_config
+
+    Returns:
+        Populated FAISS index with search parameters applied
+    """
+    index = new_index(embeddings, index_config)
+    index.add(embeddings)
+    apply_search_params(index, index_config)
+    return index
+
+
+def new_index(training_vectors: np.ndarray, index_config: Dict[str, Any]) -> faiss.Index:
+    """
+    Create an empty inner-product index, trained on training_vectors if needed
+
+    IVF nlist is capped by the number of training vectors, and PQ storage
+    falls back to SQ8 with fewer training vectors than PQ centroids
+    (2^pq_nbits). Used directly by the streaming build, which trains on a
+    sample and adds the rest in batches.
+    """
+    n, dimension = training_vectors.shape
+
+    if index_config.get("storage") == "pq":
+        pq_centroids = 1 << int(index_config.get("pq_nbits", 8))
+        if n < pq_centroids:
+            print(f"  Using sq8 instead of pq storage for {n} vectors ({pq_centroids} PQ centroids)")
+            index_config = dict(index_config, storage="sq8")
+
+    nlist = None
+    if index_config["type"] == "ivf_flat":
+        nlist = int(index_config.get("nlist", 1024))
+        max_nlist = max(1, n // MIN_POINTS_PER_CENTROID)
+        if nlist > max_nlist:
+            print(f"  Reducing nlist from {nlist} to {max_nlist} for {n} vectors")
+            nlist = max_nlist
+
+    description = factory_string(index_config, nlist)
+    index = faiss.index_factory(dimension, description, faiss.METRIC_INNER_PRODUCT)
+
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efConstruction = int(index_config.get("efConstruction", 200))
+
+    if not index.is_trained:
+        print(f"  Training {description} index...")
+        index.train(training_vectors)
+
+    return index
+
+
+def apply_search_params(index: faiss.Index, index_config: Dict[str, Any]):
+    """Set query-time knobs (nprobe / efSearch), e.g. after loading from disk"""
+    index_type = index_config["type"]
+    if index_type == "ivf_flat" and "nprobe" in index_config:
+        faiss.extract_index_ivf(index).nprobe = int(index_config["nprobe"])
+    elif index_type == "hnsw" and "efSearch" in index_config:
+        index.hnsw.efSearch = int(index_config["efSearch"])
+
+
+def read_index(index_path: str, index_config: Dict[str, Any], mmap: bool = False) -> faiss.Index:
+    """
+    Read an index from disk, optionally memory-mapped and read-only
+
+    IVF indexes map their inverted lists (IO_FLAG_MMAP); flat, SQ/PQ and HNSW
+    storage maps the code array (IO_FLAG_MMAP_IFC, FAISS >= 1.9).
+    """
+    if not mmap:
+        index = faiss.read_index(index_path)
+    else:
+        if index_config["type"] == "ivf_flat" or not hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+            flags = faiss.IO_FLAG_MMAP
+        else:
+            flags = faiss.IO_FLAG_MMAP_IFC
+        index = faiss.read_index(index_path, flags | faiss.IO_FLAG_READ_ONLY)
+
+    apply_search_params(index, index_config)
+    return index
+
+
+def search_parameters(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """
+    Build search parameters carrying an ID selector
+
+    Explicit parameters replace the index's own nprobe/efSearch, so the current
+    values are copied over rather than silently dropping to FAISS defaults.
+    """
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def reconstruct_all(index: faiss.Index) -> np.ndarray:
+    """Return every stored vector in ID order"""
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def rescore(vectors: np.ndarray, queries: np.ndarray, candidates: np.ndarray,
+            k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Re-rank approximate candidates by exact inner product on float vectors
+
+    Args:
+        vectors: Full-precision vectors (may be a read-only np.memmap)
+        queries: Query matrix (nq, dimension)
+        candidates: Candidate IDs from the quantized index (nq, k'), -1 padded
+        k: Number of results to keep per query
+
+    Returns:
+        (scores, ids) shaped (nq, k) like faiss search output
+    """
+    nq = queries.shape[0]
+    scores = np.full((nq, k), -np.inf, dtype='float32')
+    ids = np.full((nq, k), -1, dtype='int64')
+
+    for row in range(nq):
+        cand = candidates[row]
+        cand = cand[cand >= 0]
+        if not len(cand):
+            continue
+        exact = np.asarray(vectors[cand], dtype='float32') @ queries[row]
+        order = np.argsort(-exact)[:k]
+        scores[row, :len(order)] = exact[order]
+        ids[row, :len(order)] = cand[order]
+
+    return scores, ids
+
+
+def bytes_per_vector(index: faiss.Index) -> float:
+    """Serialized index size per stored vector (codes plus graph/centroid overhead)"""
+    if index.ntotal == 0:
+        return 0.0
+    # Count bytes as they are written in 1 MiB blocks instead of serializing
+    # into memory, which would briefly double the index footprint
+    written = [0]
+
+    def count(block) -> int:
+        written[0] += len(block)
+        return len(block)
+
+    faiss.write_index(index, faiss.PyCallbackIOWriter(count, 1 << 20))
+    return written[0] / index.ntotal
+
+
+def recall_at_k(search_fn: Callable[[np.ndarray, int], Tuple[np.ndarray, np.ndarray]],
+                embeddings: np.ndarray, k: int = 10,
+                num_queries: int = 200, seed: int = 0) -> float:
+    """
+    Measure recall@k of a search path against exact inner-product search
+
+    Queries are sampled from the indexed vectors themselves.
+
+    Args:
+        search_fn: Callable (queries, k) -> (scores, ids), e.g. index.search
+        embeddings: The indexed float vectors
+
+    Returns:
+        Fraction of the exact top-k neighbours that the search path also returns
+    """
+    n = embeddings.shape[0]
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    queries = embeddings[rng.choice(n, size=min(num_queries, n), replace=False)]
+
+    exact = faiss.IndexFlatIP(embeddings.shape[1])
+    exact.add(embeddings)
+    _, truth = exact.search(queries, k)
+    _, found = search_fn(queries, k)
+
+    hits = sum(
+        len(set(t[t >= 0]) & set(f[f >= 0]))
+        for t, f in zip(truth, found)
+    )
+    return hits / float(truth.size)
@@ -0,0 +1,158 @@
+"""
+Memory-mapped serving format for chunk metadata
+
+A domain's metadata is written to a directory of fixed-width numpy columns
+plus contiguous byte blobs with offsets:
+
+    meta.json               count, format version, string vocabularies
+    page.npy                int32 page number per chunk
+    source.npy              int32 code into vocab["source"]
+    domain.npy              int16 code into vocab["domain"]
+    chunk_type.npy          int16 code into vocab["chunk_type"]
+    <blob>.bin              UTF-8 bytes for text, chunk_id, grounding (JSON)
+                            and extra (JSON of any other keys)
+    <blob>_offsets.npy      int64 (count + 1) start offsets into <blob>.bin
+
+Everything is opened with mmap, so loading is O(1) and workers on one host
+share the page cache instead of each unpickling a private copy.
+"""
+import os
+import json
+import hashlib
+from typing import List, Dict, Any, Iterator, Sequence
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+CODED_FIELDS = {"source": "int32", "domain": "int16", "chunk_type": "int16"}
+TEXT_BLOBS = ("text", "chunk_id")
+JSON_BLOBS = ("grounding", "extra")
+KNOWN_FIELDS = set(CODED_FIELDS) | set(TEXT_BLOBS) | {"grounding", "page"}
+
+
+def text_hash(text: str) -> str:
+    """Content hash of a chunk's text, used to reuse embeddings of unchanged chunks"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _write_blob(directory: str, name: str, values: List[bytes]):
+    offsets = np.zeros(len(values) + 1, dtype='int64')
+    offsets[1:] = np.cumsum([len(v) for v in values])
+    with open(os.path.join(directory, f"{name}.bin"), 'wb') as f:
+        for value in values:
+            f.write(value)
+    np.save(os.path.join(directory, f"{name}_offsets.npy"), offsets)
+
+
+def write_metadata(documents: List[Dict[str, Any]], directory: str):
+    """
+    Write documents in the memory-mapped serving format
+
+    Args:
+        documents: Chunk dictionaries as produced by DataIngestion
+        directory: Output directory (created if missing)
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    vocab = {}
+    for field, dtype in CODED_FIELDS.items():
+        values = [str(doc.get(field, "")) for doc in documents]
+        vocab[field] = sorted(set(values))
+        lookup = {value: i for i, value in enumerate(vocab[field])}
+        np.save(
+            os.path.join(directory, f"{field}.npy"),
+            np.array([lookup[v] for v in values], dtype=dtype)
+        )
+
+    np.save(
+        os.path.join(directory, "page.npy"),
+        np.array([int(doc.get("page", 0) or 0) for doc in documents], dtype='int32')
+    )
+
+    for field in TEXT_BLOBS:
+        _write_blob(directory, field, [str(doc.get(field, "")).encode('utf-8') for doc in documents])
+
+    _write_blob(directory, "grounding", [
+        json.dumps(doc.get("grounding", [])).encode('utf-8') for doc in documents
+    ])
+    _write_blob(directory, "extra", [
+        json.dumps({k: v for k, v in doc.items() if k not in KNOWN_FIELDS}, default=str).encode('utf-8')
+        for doc in documents
+    ])
+
+    # meta.json is written last so a partially written directory is never loaded
+    with open(os.path.join(directory, "meta.json"), 'w') as f:
+        json.dump({"version": FORMAT_VERSION, "count": len(documents), "vocab": vocab}, f)
+
+
+def has_metadata(directory: str) -> bool:
+    """Whether a complete serving-format directory exists"""
+    return os.path.exists(os.path.join(directory, "meta.json"))
+
+
+class MappedMetadata(Sequence):
+    """
+    Read-only list of chunk dicts backed by memory-mapped columns
+
+    Indexing materializes a fresh dict for that chunk only, so it can be used
+    wherever the pickled list of documents was used.
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported metadata format version {meta.get('version')} in {directory}")
+
+        self.directory = directory
+        self._count = int(meta["count"])
+        self._vocab = meta["vocab"]
+
+        def load(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+
+        self._codes = {field: load(field) for field in CODED_FIELDS}
+        self._page = load("page")
+        self._blobs = {}
+        for name in TEXT_BLOBS + JSON_BLOBS:
+            path = os.path.join(directory, f"{name}.bin")
+            # np.memmap cannot map an empty file
+            data = np.memmap(path, dtype='uint8', mode='r') if os.path.getsize(path) else np.zeros(0, dtype='uint8')
+            self._blobs[name] = (data, load(f"{name}_offsets"))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _read(self, name: str, idx: int) -> str:
+        data, offsets = self._blobs[name]
+        return data[offsets[idx]:offsets[idx + 1]].tobytes().decode('utf-8')
+
+    def text(self, idx: int) -> str:
+        """Chunk text without building the full dict"""
+        return self._read("text", idx)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self._count))]
+        idx = int(idx)
+        if idx < 0:
+            idx += self._count
+        if not 0 <= idx < self._count:
+            raise IndexError("metadata index out of range")
+
+        document = {
+            "text": self._read("text", idx),
+            "source": self._vocab["source"][self._codes["source"][idx]],
+            "domain": self._vocab["domain"][self._codes["domain"][idx]],
+            "page": int(self._page[idx]),
+            "chunk_type": self._vocab["chunk_type"][self._codes["chunk_type"][idx]],
+            "chunk_id": self._read("chunk_id", idx),
+            "grounding": json.loads(self._read("grounding", idx))
+        }
+        document.update(json.loads(self._read("extra", idx)))
+        return document
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for idx in range(self._count):
+            yield self[idx]
@@ -0,0 +1,124 @@
+"""
+Versioned index directories
+
+Layout under INDEX_DIR:
+    versions/<version>/covid_index.faiss, covid_metadata.pkl, ...
+    CURRENT                  name of the active version
+
+Each build writes a complete new version directory and then points CURRENT
+at it, so a server can load (and later reload) a consistent set of files.
+An INDEX_DIR without CURRENT is read in the original flat layout and
+reported as version "unversioned".
+"""
+import os
+import time
+import shutil
+from typing import List, Dict, Optional, Tuple
+
+from config import DOMAINS, INDEX_DIR, MERGED_INDEX_PATH, MERGED_METADATA_PATH, MERGED_VECTORS_PATH
+
+CURRENT_FILE = "CURRENT"
+# Per-version manifest of source file hashes (see update_index.py)
+SOURCES_FILE = "sources.json"
+VERSIONS_DIR = "versions"
+UNVERSIONED = "unversioned"
+
+# Per-domain file keys in config.DOMAINS
+PATH_KEYS = ("index_path", "metadata_path", "vectors_path", "serving_path", "sparse_path")
+
+
+def domain_paths(domain: str, index_dir: str) -> Dict[str, str]:
+    """A domain's index files (same names as in config.DOMAINS) inside index_dir"""
+    return {
+        key: os.path.join(index_dir, os.path.basename(DOMAINS[domain][key]))
+        for key in PATH_KEYS
+    }
+
+
+def merged_paths(index_dir: str) -> Dict[str, str]:
+    """Merged cross-domain index files inside index_dir"""
+    return {
+        "index_path": os.path.join(index_dir, os.path.basename(MERGED_INDEX_PATH)),
+        "metadata_path": os.path.join(index_dir, os.path.basename(MERGED_METADATA_PATH)),
+        "vectors_path": os.path.join(index_dir, os.path.basename(MERGED_VECTORS_PATH))
+    }
+
+
+def version_dir(version: str, root: str = INDEX_DIR) -> str:
+    if version == UNVERSIONED:
+        return root
+    return os.path.join(root, VERSIONS_DIR, version)
+
+
+def active_version(root: str = INDEX_DIR) -> Optional[str]:
+    """Version named in CURRENT, or None for the flat layout"""
+    path = os.path.join(root, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read().strip() or None
+
+
+def resolve_version(version: Optional[str] = None, root: str = INDEX_DIR) -> Tuple[str, str]:
+    """
+    Args:
+        version: Version to load; None for the active one
+
+    Returns:
+        (version, directory); raises ValueError for a name that is not
+        "unversioned" or one of list_versions()
+    """
+    if version is None:
+        version = active_version(root) or UNVERSIONED
+    # Only names of existing version directories: a path would let a caller
+    # load (and unpickle) files from anywhere on disk
+    if version != UNVERSIONED and (
+        os.sep in version or "/" in version or ".." in version or version not in list_versions(root)
+    ):
+        raise ValueError(f"Index version '{version}' not found in {root}")
+    directory = version_dir(version, root)
+    if not os.path.isdir(directory):
+        raise ValueError(f"Index version '{version}' not found in {root}")
+    return version, directory
+
+
+def list_versions(root: str = INDEX_DIR) -> List[str]:
+    """Available versions, oldest first"""
+    versions_root = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(versions_root):
+        return []
+    return sorted(
+        name for name in os.listdir(versions_root)
+        if os.path.isdir(os.path.join(versions_root, name))
+    )
+
+
+def new_version(root: str = INDEX_DIR) -> str:
+    """Timestamped, lexically sortable version name not yet used under root"""
+    base = time.strftime("%Y%m%d-%H%M%S")
+    version = base
+    suffix = 1
+    # Never reuse a name: its files may be open or memory-mapped by a server
+    while os.path.exists(version_dir(version, root)):
+        version = f"{base}.{suffix}"
+        suffix += 1
+    return version
+
+
+def publish_version(version: str, root: str = INDEX_DIR, keep: int = 3):
+    """
+    Make a fully written version the active one
+
+    CURRENT is replaced atomically. Versions beyond the newest `keep` are
+    deleted; servers still using one keep their already-open and
+    memory-mapped files until they reload.
+    """
+    tmp_path = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+    if keep > 0:
+        for old in list_versions(root)[:-keep]:
+            if old != version:
+                shutil.rmtree(version_dir(old, root), ignore_errors=True)
@@ -0,0 +1,86 @@
+"""
+Non-blocking, pooled HTTP client for OpenRouter chat completions
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, AsyncIterator
+
+import httpx
+
+
+class OpenRouterClient:
+    """
+    Shared httpx.AsyncClient with keep-alive and a cap on in-flight calls
+
+    One instance is used by every request in a worker, so TLS connections are
+    reused and the event loop keeps serving other requests while calls wait
+    on the network. The client is created lazily inside the running loop.
+    """
+
+    def __init__(self, url: str, headers: Dict[str, str], max_connections: int = 100,
+                 max_keepalive: int = 20, keepalive_expiry: float = 60.0,
+                 max_concurrency: int = 32, connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0):
+        self.url = url
+        self.headers = headers
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.read_timeout = read_timeout
+        self.max_concurrency = max_concurrency
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.requests = 0
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                limits=self.limits,
+                timeout=self.timeout
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    @asynccontextmanager
+    async def _slot(self):
+        client = self._ensure_client()
+        async with self._semaphore:
+            self.in_flight += 1
+            self.requests += 1
+            try:
+                yield client
+            finally:
+                self.in_flight -= 1
+
+    async def post(self, payload: Dict[str, Any]) -> httpx.Response:
+        """Send a non-streaming completion request"""
+        async with self._slot() as client:
+            return await client.post(self.url, json=payload)
+
+    @asynccontextmanager
+    async def stream(self, payload: Dict[str, Any]) -> AsyncIterator[httpx.Response]:
+        """Open a streaming completion request; iterate response.aiter_lines()"""
+        async with self._slot() as client:
+            async with client.stream("POST", self.url, json=payload) as response:
+                yield response
+
+    async def aclose(self):
+        """Close pooled connections (on application shutdown)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool and concurrency figures for the health endpoint"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_connections": self.limits.max_connections,
+            "in_flight": self.in_flight,
+            "requests": self.requests
+        }
@@ -1,17 +1,30 @@
 """
 FastAPI backend for Clinical AI Assistant
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import os
+import hmac
+import json
+import asyncio
 import logging
 from datetime import datetime
 
-from rag_pipeline import RAGPipeline
-from visualizer import Visualizer
-from config import DOMAINS
+# rag_pipeline (torch, sentence-transformers, faiss) and visualizer
+# (matplotlib, seaborn, wordcloud) are imported lazily so the server starts
+# accepting liveness probes immediately
+from executors import BoundedExecutor, StageOverloaded, configure_threads
+from index_versions import resolve_version, list_versions
+from config import (
+    DOMAINS, MAX_BATCH_QUERIES, MAX_TOP_K, TOP_K_RESULTS,
+    RETRIEVAL_WORKERS, RETRIEVAL_QUEUE,
+    RENDER_WORKERS, RENDER_QUEUE, RENDER_EXECUTOR,
+    TORCH_NUM_THREADS, FAISS_NUM_THREADS,
+    WARMUP_ENABLED, WARMUP_QUERIES, ADMIN_TOKEN
+)
 
 # Configure logging
 logging.basicConfig(
@@ -46,20 +59,142 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize RAG pipeline and visualizer
-rag_pipeline = RAGPipeline()
-visualizer = Visualizer()
+# RAG pipeline, created in the background by startup_event
+rag_pipeline = None
+startup_state = {
+    "stage": "starting",  # starting, loading_model, loading_indexes, warming_up, ready, failed
+    "ready": False,
+    "error": None,
+    "startup_seconds": None
+}
 
-# Load indexes on startup
-@app.on_event("startup")
-async def startup_event():
-    """Load indexes when server starts"""
+# Embedding + FAISS search and chart rendering are CPU-bound; run them on
+# bounded pools so the event loop keeps serving other requests
+retrieval_executor = BoundedExecutor("retrieval", RETRIEVAL_WORKERS, RETRIEVAL_QUEUE)
+render_executor = BoundedExecutor("render", RENDER_WORKERS, RENDER_QUEUE, kind=RENDER_EXECUTOR)
+
+
+def initialize_pipeline():
+    """Import and build the RAG pipeline, load indexes and warm up (blocking)"""
+    global rag_pipeline
+    start_time = datetime.now()
+    
+    try:
+        startup_state["stage"] = "loading_model"
+        from rag_pipeline import RAGPipeline
+        configure_threads(TORCH_NUM_THREADS, FAISS_NUM_THREADS)
+        pipeline = RAGPipeline()
+        
+        startup_state["stage"] = "loading_indexes"
+        try:
+            pipeline.load_indexes()
+            print("RAG pipeline initialized successfully")
+        except Exception as e:
+            print(f"Warning: Could not load indexes: {e}")
+            print("Please run data_ingestion.py and rag_pipeline.py first to build indexes")
+        
+        if WARMUP_ENABLED and pipeline.indexes:
+            startup_state["stage"] = "warming_up"
+            pipeline.warmup(WARMUP_QUERIES)
+        
+        rag_pipeline = pipeline
+        # Without indexes the API is up but cannot answer, so stay unready
+        startup_state["ready"] = bool(pipeline.indexes)
+        startup_state["stage"] = "ready"
+    except Exception as e:
+        startup_state["stage"] = "failed"
+        startup_state["error"] = str(e)
+        logger.exception("❌ Startup failed:")
+    finally:
+        startup_state["startup_seconds"] = round((datetime.now() - start_time).total_seconds(), 2)
+        logger.info(f"🚦 Startup finished in {startup_state['startup_seconds']}s (stage: {startup_state['stage']})")
+
+
+# Progress of the last POST /admin/reload
+reload_state = {
+    "status": "idle",  # idle, running, done, failed
+    "requested_version": None,
+    "error": None,
+    "seconds": None
+}
+
+
+def reload_indexes(version: Optional[str]):
+    """Load an index version next to the serving one and swap it in (blocking)"""
+    global rag_pipeline
+    start_time = datetime.now()
+    
     try:
-        rag_pipeline.load_indexes()
-        print("RAG pipeline initialized successfully")
+        old_version = rag_pipeline.index_version
+        pipeline = rag_pipeline.fork()
+        pipeline.load_indexes(version)
+        if not pipeline.indexes:
+            raise RuntimeError(f"No indexes found in version {pipeline.index_version}")
+        if WARMUP_ENABLED:
+            # The fork shares the serving pipeline's query cache; keep it warm
+            pipeline.warmup(WARMUP_QUERIES, clear_query_cache=False)
+        
+        # Single reference swap: new requests see the new indexes, requests
+        # already holding the old pipeline finish on it, and its indexes and
+        # memory maps are freed when the last of them drops it
+        rag_pipeline = pipeline
+        if pipeline.reranker is not None:
+            pipeline.reranker.clear_cache()
+        startup_state["ready"] = True
+        
+        reload_state["status"] = "done"
+        logger.info(f"🔄 Index version {old_version} -> {pipeline.index_version}")
     except Exception as e:
-        print(f"Warning: Could not load indexes: {e}")
-        print("Please run data_ingestion.py and rag_pipeline.py first to build indexes")
+        reload_state["status"] = "failed"
+        reload_state["error"] = str(e)
+        logger.exception("❌ Index reload failed:")
+    finally:
+        reload_state["seconds"] = round((datetime.now() - start_time).total_seconds(), 2)
+
+
+def check_admin_token(token: Optional[str]):
+    """Admin endpoints are disabled (503) unless ADMIN_TOKEN is set, and need it (403)"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if token is None or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def get_pipeline():
+    """The RAG pipeline, or a 503 while it is still starting"""
+    if rag_pipeline is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service is starting ({startup_state['stage']}). Please retry shortly.",
+            headers={"Retry-After": "1"}
+        )
+    return rag_pipeline
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Load the pipeline in the background so the server accepts connections right away"""
+    asyncio.get_running_loop().run_in_executor(None, initialize_pipeline)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled LLM connections and worker pools"""
+    if rag_pipeline is not None:
+        await rag_pipeline.llm_client.aclose()
+    retrieval_executor.shutdown()
+    render_executor.shutdown()
+
+
+@app.exception_handler(StageOverloaded)
+async def stage_overloaded_handler(request, exc: StageOverloaded):
+    """Shed load when a CPU-bound stage is saturated"""
+    logger.warning(f"⚠️ Rejected request: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Server busy ({exc.stage} queue full). Please retry."},
+        headers={"Retry-After": "1"}
+    )
 
 
 # Pydantic models
@@ -73,6 +208,27 @@ class QueryResponse(BaseModel):
     sources: List[Dict[str, Any]]
     confidence: str
     retrieved_docs: List[Dict[str, Any]]
+    cached: bool = False
+
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    domain: Optional[str] = None
+    k: int = TOP_K_RESULTS
+    generate: bool = False  # False = retrieval only
+
+
+class BatchQueryResult(BaseModel):
+    query: str
+    retrieved_docs: List[Dict[str, Any]]
+    response: Optional[str] = None
+    sources: Optional[List[Dict[str, Any]]] = None
+    confidence: Optional[str] = None
+    cached: Optional[bool] = None
+
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryResult]
 
 
 class FeedbackRequest(BaseModel):
@@ -87,6 +243,10 @@ class GraphRequest(BaseModel):
     viz_type: str = "wordcloud"  # wordcloud, term_frequency, sources, similarity
 
 
+class ReloadRequest(BaseModel):
+    version: Optional[str] = None  # None = version marked active in CURRENT
+
+
 # API endpoints
 @app.get("/")
 async def root():
@@ -136,7 +296,8 @@ async def query(request: QueryRequest):
             raise HTTPException(status_code=400, detail="Query cannot be empty")
         
         # Check if indexes are loaded
-        if not rag_pipeline.indexes:
+        pipeline = get_pipeline()
+        if not pipeline.indexes:
             logger.error(f"❌ RAG pipeline not initialized")
             raise HTTPException(
                 status_code=503,
@@ -153,18 +314,19 @@ async def query(request: QueryRequest):
         
         # Retrieve relevant documents
         logger.info(f"🔍 Retrieving documents...")
-        retrieved_docs = rag_pipeline.retrieve(request.query, request.domain)
+        retrieved_docs = await retrieval_executor.run(pipeline.retrieve, request.query, request.domain)
         logger.info(f"   Found {len(retrieved_docs)} relevant documents")
         
         # Generate response (OpenRouter call happens here - logged in rag_pipeline.py)
         logger.info(f"💬 Generating response...")
-        result = rag_pipeline.generate_response(request.query, retrieved_docs)
+        result = await pipeline.agenerate_response(request.query, retrieved_docs)
         
         # Log completion
         elapsed = (datetime.now() - start_time).total_seconds()
         logger.info(f"✅ Query completed:")
         logger.info(f"   Total time: {elapsed:.2f}s")
         logger.info(f"   Confidence: {result['confidence']}")
+        logger.info(f"   Cached: {result['cached']}")
         logger.info(f"   Sources: {len(result['sources'])}")
         
         # Return complete response
@@ -172,10 +334,11 @@ async def query(request: QueryRequest):
             response=result["response"],
             sources=result["sources"],
             confidence=result["confidence"],
-            retrieved_docs=retrieved_docs
+            retrieved_docs=retrieved_docs,
+            cached=result["cached"]
         )
         
-    except HTTPException:
+    except (HTTPException, StageOverloaded):
         raise
     except Exception as e:
         elapsed = (datetime.now() - start_time).total_seconds()
@@ -184,6 +347,154 @@ async def query(request: QueryRequest):
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
 
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    """
+    Process a clinical query and stream the answer as Server-Sent Events
+    
+    The "sources" event (evidence and retrieved docs) is sent as soon as
+    retrieval finishes, followed by "token" events as the LLM generates and a
+    final "done" event with confidence and token usage (or an "error" event).
+    
+    Args:
+        request: QueryRequest with query text and optional domain
+        
+    Returns:
+        text/event-stream response
+    """
+    logger.info(f"📥 New streaming query received:")
+    logger.info(f"   Query: {request.query[:100]}...")
+    logger.info(f"   Domain: {request.domain or 'All domains'}")
+    
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    
+    # Check if indexes are loaded
+    pipeline = get_pipeline()
+    if not pipeline.indexes:
+        raise HTTPException(
+            status_code=503,
+            detail="RAG pipeline not initialized. Please build indexes first."
+        )
+    
+    # Validate domain if provided
+    if request.domain and request.domain not in DOMAINS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid domain. Valid domains: {list(DOMAINS.keys())}"
+        )
+    
+    try:
+        retrieved_docs = await retrieval_executor.run(pipeline.retrieve, request.query, request.domain)
+    except StageOverloaded:
+        raise
+    except Exception as e:
+        logger.exception("Full traceback:")
+        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+    
+    async def event_stream():
+        async for event, data in pipeline.astream_response(request.query, retrieved_docs):
+            if event == "sources":
+                data = {**data, "retrieved_docs": retrieved_docs}
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def query_batch(request: BatchQueryRequest):
+    """
+    Process many clinical queries in one request
+    
+    Queries are embedded together and each index is searched once for the
+    whole batch. Generation is optional and runs concurrently per query.
+    
+    Args:
+        request: BatchQueryRequest with queries, optional domain and k
+        
+    Returns:
+        BatchQueryResponse with one result per query, in input order
+    """
+    start_time = datetime.now()
+    
+    try:
+        logger.info(f"📥 Batch query received:")
+        logger.info(f"   Queries: {len(request.queries)}")
+        logger.info(f"   Domain: {request.domain or 'All domains'}")
+        logger.info(f"   Generate: {request.generate}")
+        
+        if not request.queries:
+            raise HTTPException(status_code=400, detail="Queries cannot be empty")
+        
+        if any(not q.strip() for q in request.queries):
+            raise HTTPException(status_code=400, detail="Query cannot be empty")
+        
+        if len(request.queries) > MAX_BATCH_QUERIES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many queries. Maximum batch size: {MAX_BATCH_QUERIES}"
+            )
+        
+        if request.k < 1:
+            raise HTTPException(status_code=400, detail="k must be at least 1")
+        
+        if request.k > MAX_TOP_K:
+            raise HTTPException(status_code=400, detail=f"k too large. Maximum k: {MAX_TOP_K}")
+        
+        # Check if indexes are loaded
+        pipeline = get_pipeline()
+        if not pipeline.indexes:
+            raise HTTPException(
+                status_code=503,
+                detail="RAG pipeline not initialized. Please build indexes first."
+            )
+        
+        # Validate domain if provided
+        if request.domain and request.domain not in DOMAINS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid domain. Valid domains: {list(DOMAINS.keys())}"
+            )
+        
+        batch_docs = await retrieval_executor.run(
+            pipeline.retrieve_many, request.queries, request.domain, k=request.k
+        )
+        
+        results = [
+            BatchQueryResult(query=query_text, retrieved_docs=retrieved_docs)
+            for query_text, retrieved_docs in zip(request.queries, batch_docs)
+        ]
+        
+        if request.generate:
+            # LLM calls run concurrently, bounded by the client's concurrency limit
+            generated = await asyncio.gather(*[
+                pipeline.agenerate_response(item.query, item.retrieved_docs)
+                for item in results
+            ])
+            for item, result in zip(results, generated):
+                item.response = result["response"]
+                item.sources = result["sources"]
+                item.confidence = result["confidence"]
+                item.cached = result["cached"]
+        
+        elapsed = (datetime.now() - start_time).total_seconds()
+        logger.info(f"✅ Batch completed: {len(results)} queries in {elapsed:.2f}s")
+        
+        return BatchQueryResponse(results=results)
+        
+    except (HTTPException, StageOverloaded):
+        raise
+    except Exception as e:
+        elapsed = (datetime.now() - start_time).total_seconds()
+        logger.error(f"❌ Batch query failed after {elapsed:.2f}s: {str(e)}")
+        logger.exception("Full traceback:")
+        raise HTTPException(status_code=500, detail=f"Error processing batch query: {str(e)}")
+
+
 @app.post("/feedback")
 async def submit_feedback(request: FeedbackRequest):
     """
@@ -220,14 +531,17 @@ async def generate_graph(request: GraphRequest):
             raise HTTPException(status_code=400, detail="Query cannot be empty")
         
         # Check if indexes are loaded
-        if not rag_pipeline.indexes:
+        pipeline = get_pipeline()
+        if not pipeline.indexes:
             raise HTTPException(
                 status_code=503,
                 detail="RAG pipeline not initialized. Please build indexes first."
             )
         
         # Retrieve relevant documents
-        retrieved_docs = rag_pipeline.retrieve(request.query, request.domain, k=10)
+        retrieved_docs = await retrieval_executor.run(
+            pipeline.retrieve, request.query, request.domain, k=10
+        )
         
         if not retrieved_docs:
             raise HTTPException(
@@ -236,7 +550,9 @@ async def generate_graph(request: GraphRequest):
             )
         
         # Generate visualization
-        img_base64 = visualizer.generate_combined_visualization(
+        from visualizer import render_visualization
+        img_base64 = await render_executor.run(
+            render_visualization,
             retrieved_docs,
             request.viz_type
         )
@@ -247,22 +563,83 @@ async def generate_graph(request: GraphRequest):
             "num_documents": len(retrieved_docs)
         }
         
-    except HTTPException:
+    except (HTTPException, StageOverloaded):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating graph: {str(e)}")
 
 
+@app.post("/admin/reload", status_code=202)
+async def admin_reload(request: ReloadRequest, x_admin_token: Optional[str] = Header(None)):
+    """
+    Load an index version in the background and swap it in without downtime
+    
+    Args:
+        request: ReloadRequest with an optional version name
+        
+    Returns:
+        Acknowledgement; poll GET /admin/reload for the outcome
+    """
+    check_admin_token(x_admin_token)
+    pipeline = get_pipeline()
+    
+    if reload_state["status"] == "running":
+        raise HTTPException(status_code=409, detail="A reload is already running")
+    
+    try:
+        resolve_version(request.version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    reload_state.update(status="running", requested_version=request.version, error=None, seconds=None)
+    asyncio.get_running_loop().run_in_executor(None, reload_indexes, request.version)
+    
+    return {
+        "status": "accepted",
+        "active_version": pipeline.index_version,
+        "requested_version": request.version or "current"
+    }
+
+
+@app.get("/admin/reload")
+async def admin_reload_status(x_admin_token: Optional[str] = Header(None)):
+    """State of the last reload, the active index version and versions on disk"""
+    check_admin_token(x_admin_token)
+    return {
+        **reload_state,
+        "active_version": rag_pipeline.index_version if rag_pipeline is not None else None,
+        "available_versions": list_versions()
+    }
+
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up and serving HTTP"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: model loaded, indexes loaded and warmed up"""
+    if not startup_state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "not_ready", **startup_state})
+    return {"status": "ready", **startup_state}
+
+
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
+    if rag_pipeline is None:
+        return {"status": "starting", "startup": startup_state}
+    
+    pipeline = rag_pipeline
     index_status = {}
     
     for domain in DOMAINS.keys():
-        if domain in rag_pipeline.indexes:
+        if domain in pipeline.indexes:
             index_status[domain] = {
                 "loaded": True,
-                "num_vectors": rag_pipeline.indexes[domain].ntotal
+                "num_vectors": pipeline.indexes[domain].ntotal
             }
         else:
             index_status[domain] = {
@@ -272,8 +649,34 @@ async def health_check():
     
     return {
         "status": "healthy",
+        "startup": startup_state,
+        "index_version": pipeline.index_version,
         "indexes": index_status,
-        "total_domains": len(DOMAINS)
+        "total_domains": len(DOMAINS),
+        "merged_index": {
+            "loaded": pipeline.merged_index is not None,
+            "num_vectors": pipeline.merged_index.ntotal if pipeline.merged_index is not None else 0
+        },
+        "embedding_backend": pipeline.embedding_backend,
+        "query_cache": pipeline.query_cache.stats(),
+        "llm_client": pipeline.llm_client.stats(),
+        "response_cache": (
+            # stats() counts rows, which hits the disk for the sqlite backend
+            await asyncio.to_thread(pipeline.response_cache.stats)
+            if pipeline.response_cache is not None else None
+        ),
+        "reranker": (
+            pipeline.reranker.stats()
+            if pipeline.reranker is not None else None
+        ),
+        "embedding_batcher": (
+            pipeline.embedding_batcher.stats()
+            if pipeline.embedding_batcher is not None else None
+        ),
+        "executors": {
+            "retrieval": retrieval_executor.stats(),
+            "render": render_executor.stats()
+        }
     }
 
 
@@ -0,0 +1,125 @@
+"""
+Dynamic micro-batching of concurrent query embeddings
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Dict, Any, Tuple
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """
+    Collects texts submitted from concurrent callers and encodes them together
+
+    A single worker thread owns the embedding model. It waits for the first
+    text, then keeps collecting until either max_batch_size texts are queued or
+    max_wait_ms has passed since that first text, encodes the batch in one
+    call and resolves each caller's future with its own row.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue: "queue.Queue[Tuple[str, Future, float]]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._closed = False
+
+        # Metrics
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.total_encode_time = 0.0
+
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for encoding; the future resolves to a 1-D float32 vector"""
+        if self._closed:
+            raise RuntimeError("EmbeddingBatcher is closed")
+        future: Future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Blocking helper: submit texts and wait for all of their vectors"""
+        futures = [self.submit(text) for text in texts]
+        return np.vstack([future.result() for future in futures])
+
+    def close(self):
+        """Stop the worker after the queued texts are processed"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._worker.join()
+
+    def _collect(self) -> List[Tuple[str, Future, float]]:
+        """Block for the first item, then gather more until full or the window closes"""
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-queue the sentinel so the loop exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+
+            start = time.perf_counter()
+            waits = [start - enqueued for _, _, enqueued in batch]
+            try:
+                vectors = self.encode_fn([text for text, _, _ in batch])
+                for (_, future, _), vector in zip(batch, vectors):
+                    future.set_result(np.asarray(vector, dtype='float32'))
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            encode_time = time.perf_counter() - start
+
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.max_batch_seen = max(self.max_batch_seen, len(batch))
+                self.total_queue_wait += sum(waits)
+                self.max_queue_wait = max(self.max_queue_wait, max(waits))
+                self.total_encode_time += encode_time
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch-size and queue-wait metrics for the health endpoint"""
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "max_batch_seen": self.max_batch_seen,
+                "avg_queue_wait_ms": round(self.total_queue_wait / self.items * 1000.0, 3) if self.items else 0.0,
+                "max_queue_wait_ms": round(self.max_queue_wait * 1000.0, 3),
+                "avg_encode_ms": round(self.total_encode_time / self.batches * 1000.0, 3) if self.batches else 0.0,
+                "queue_depth": self._queue.qsize()
+            }
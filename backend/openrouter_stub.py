@@ -0,0 +1,66 @@
+"""
+Local stand-in for the OpenRouter chat completions API, for offline testing
+
+Usage:
+    uvicorn openrouter_stub:app --port 8001
+    OPENROUTER_BASE_URL=http://localhost:8001/api/v1/chat/completions uvicorn main:app
+
+STUB_LATENCY_MS sets the delay before the answer (or first token) and
+STUB_TOKEN_DELAY_MS the gap between streamed tokens.
+"""
+import os
+import json
+import time
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+LATENCY = float(os.getenv("STUB_LATENCY_MS", "500")) / 1000.0
+TOKEN_DELAY = float(os.getenv("STUB_TOKEN_DELAY_MS", "20")) / 1000.0
+
+app = FastAPI(title="OpenRouter stub")
+
+
+def _answer(payload: dict) -> str:
+    prompt = payload["messages"][-1]["content"]
+    sources = prompt.count("[Source ")
+    return f"Stub answer based on {sources} sources [Source 1]. The context supports this conclusion."
+
+
+def _usage(payload: dict, answer: str) -> dict:
+    prompt_tokens = sum(len(m["content"].split()) for m in payload["messages"])
+    completion_tokens = len(answer.split())
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
+@app.post("/api/v1/chat/completions")
+async def chat_completions(request: Request):
+    payload = await request.json()
+    answer = _answer(payload)
+    await asyncio.sleep(LATENCY)
+
+    if not payload.get("stream"):
+        return {
+            "id": f"stub-{time.time_ns()}",
+            "model": payload.get("model"),
+            "choices": [{"message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": _usage(payload, answer)
+        }
+
+    async def events():
+        yield ": OPENROUTER PROCESSING\n\n"
+        words = answer.split(" ")
+        for i, word in enumerate(words):
+            text = word if i == 0 else f" {word}"
+            yield f"data: {json.dumps({'choices': [{'delta': {'content': text}}]})}\n\n"
+            await asyncio.sleep(TOKEN_DELAY)
+        final = {"choices": [{"delta": {}, "finish_reason": "stop"}], "usage": _usage(payload, answer)}
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,49 @@
+"""
+Content-addressed on-disk cache for document parse results
+
+Entries live at <cache_dir>/<key[:2]>/<key>.json.gz where the key is a
+SHA-256 over the document hash and the parse options, so a changed file or
+changed options simply miss. Writes are atomic, so concurrent ingestion
+workers (and interrupted runs) never leave a truncated entry behind.
+"""
+import os
+import gzip
+import json
+import hashlib
+from typing import Dict, Any, Optional
+
+
+def cache_key(content_hash: str, options: Dict[str, Any]) -> str:
+    """Key for a document's content hash parsed with the given options"""
+    payload = json.dumps({"content": content_hash, "options": options}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ParseCache:
+    """Gzipped-JSON parse results keyed by cache_key()"""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json.gz")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached result, or None if missing or unreadable"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Corrupt entry: treat as a miss and let put() overwrite it
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{id(result)}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
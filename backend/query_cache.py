@@ -0,0 +1,84 @@
+"""
+LRU cache for query embeddings
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize query text for cache lookups
+
+    Collapses whitespace and lowercases. all-MiniLM-L6-v2 uses an uncased
+    tokenizer, so lowercasing does not change the embedding.
+    """
+    return " ".join(query.split()).lower()
+
+
+def chunk_key(doc: Dict[str, Any]) -> str:
+    """Stable identifier of a retrieved chunk across requests"""
+    return f"{doc.get('domain', '')}|{doc.get('source', '')}|{doc.get('page', '')}|{doc.get('chunk_id', '')}"
+
+
+class QueryEmbeddingCache:
+    """Bounded, thread-safe LRU map of normalized query text -> L2-normalized vector"""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for a query, or None on a miss"""
+        if self.max_size <= 0:
+            return None
+
+        key = normalize_query(query)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, query: str, embedding: np.ndarray):
+        """Store an embedding, evicting the least recently used entry if full"""
+        if self.max_size <= 0:
+            return
+
+        key = normalize_query(query)
+        # Cached vectors are shared between callers, so make them read-only
+        embedding = np.array(embedding, dtype='float32', copy=True).reshape(-1)
+        embedding.setflags(write=False)
+
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the health endpoint"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
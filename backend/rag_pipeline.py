@@ -2,23 +2,116 @@
 RAG Pipeline: Retrieval and Generation using FAISS and OpenRouter
 """
 import os
+import sys
+import copy
+import asyncio
+import json
 import pickle
+from functools import partial
 import numpy as np
 import faiss
-from typing import List, Dict, Any, Optional
-from sentence_transformers import SentenceTransformer
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Iterable
 import requests
+import httpx
 import logging
 from datetime import datetime
 
 from config import (
     EMBEDDING_MODEL, 
+    EMBEDDING_BACKEND,
+    EMBEDDING_ONNX_FILE,
+    EMBEDDING_PARITY_CHECK,
+    EMBEDDING_PARITY_THRESHOLD,
     TOP_K_RESULTS, 
     MIN_SIMILARITY_SCORE,
     OPENROUTER_API_KEY,
     OPENROUTER_BASE_URL,
     OPENROUTER_MODEL,
-    DOMAINS
+    DOMAINS,
+    QUERY_CACHE_SIZE,
+    MERGED_INDEX_ENABLED,
+    INDEX_VERSIONING,
+    INDEX_VERSIONS_KEEP,
+    RECALL_CHECK_QUERIES,
+    EMBED_BATCH_ENABLED,
+    EMBED_BATCH_MAX_SIZE,
+    EMBED_BATCH_MAX_WAIT_MS,
+    INDEX_MMAP,
+    HYBRID_SEARCH_ENABLED,
+    HYBRID_FUSION,
+    HYBRID_CANDIDATES,
+    HYBRID_RRF_K,
+    HYBRID_DENSE_WEIGHT,
+    CONTEXT_CHUNKS,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_MAX_CHUNK_TOKENS,
+    CONTEXT_DUPLICATE_THRESHOLD,
+    CONTEXT_CHARS_PER_TOKEN,
+    RERANK_ENABLED,
+    RERANK_MODEL,
+    RERANK_CANDIDATES,
+    RERANK_BATCH_SIZE,
+    RERANK_BUDGET_MS,
+    RERANK_CACHE_SIZE,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_BACKEND,
+    RESPONSE_CACHE_SIZE,
+    RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_PATH,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_MAX_CONCURRENCY,
+    LLM_CONNECT_TIMEOUT,
+    LLM_READ_TIMEOUT,
+    INDEX_DIR,
+    STREAM_EMBED_BATCH,
+    STREAM_PREFETCH_BATCHES,
+    STREAM_TRAIN_SIZE,
+    EMBEDDING_STORE_ENABLED,
+    EMBEDDING_STORE_DIR,
+    BULK_ENCODE_WORKERS,
+    BULK_ENCODE_BATCH,
+    BULK_ENCODE_MIN_TEXTS,
+    DEDUP_ENABLED,
+    DEDUP_NEAR_THRESHOLD,
+    DEDUP_SHINGLE_WORDS,
+    DEDUP_NUM_PERM,
+    DEDUP_BANDS
+)
+from query_cache import QueryEmbeddingCache
+from micro_batcher import EmbeddingBatcher
+from index_store import write_metadata, has_metadata, MappedMetadata, text_hash
+from sparse_index import SparseIndex, fuse_rankings
+from reranker import Reranker
+from response_cache import make_response_key, create_response_cache
+from llm_client import OpenRouterClient
+from context_packer import ContextPacker, estimate_tokens
+from embedding_backend import load_embedding_model, check_parity, PARITY_TEXTS
+from embedding_store import EmbeddingStore
+from bulk_encoder import BulkEncoder
+from dedup import DuplicateFilter
+from index_versions import (
+    domain_paths,
+    merged_paths,
+    version_dir,
+    resolve_version,
+    new_version,
+    publish_version,
+    UNVERSIONED,
+    SOURCES_FILE
+)
+from streaming_build import prefetch, rebatch, StreamingIndexBuilder
+from index_factory import (
+    get_index_config,
+    create_index,
+    read_index,
+    search_parameters,
+    reconstruct_all,
+    is_quantized,
+    rescore,
+    bytes_per_vector,
+    recall_at_k
 )
 
 # Configure logging
@@ -28,15 +121,130 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Bump whenever the prompt template in generate_response changes, so cached
+# answers produced by the old prompt are not served
+PROMPT_VERSION = "2"
+
+NO_CONTEXT_RESPONSE = (
+    "I couldn't find sufficient information in the provided datasets to answer your question. "
+    "Please try rephrasing your query or ask about a different topic within the clinical domains "
+    "(COVID, Diabetes/Heart Attack, or Knee Injuries)."
+)
+
+
+def encode_texts(model, texts: List[str]) -> np.ndarray:
+    """Run an embedding model on a list of query texts"""
+    return model.encode(
+        texts, 
+        convert_to_numpy=True
+    ).astype('float32')
+
 
 class RAGPipeline:
     """Retrieval-Augmented Generation pipeline using FAISS and OpenRouter"""
     
     def __init__(self):
-        self.embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+        self.embedding_backend = EMBEDDING_BACKEND
+        self.embedding_model = self._load_embedding_model()
+        self.dimension = 384  # MiniLM embedding dimension
+        # Persistent chunk embeddings, opened on the first index build
+        self.embedding_store = None
+        # Worker pool for large encodes during builds (see _encode_chunks)
+        self.bulk_encoder = None
+        self._reset_index_state()
+        self.query_cache = QueryEmbeddingCache(QUERY_CACHE_SIZE)
+        
+        # Cache of generated answers (see generate_response)
+        self.response_cache = None
+        if RESPONSE_CACHE_ENABLED:
+            self.response_cache = create_response_cache(
+                RESPONSE_CACHE_BACKEND,
+                RESPONSE_CACHE_SIZE,
+                RESPONSE_CACHE_TTL_SECONDS,
+                RESPONSE_CACHE_PATH
+            )
+        
+        # Pooled async HTTP client used by the API for LLM calls
+        self.llm_client = OpenRouterClient(
+            OPENROUTER_BASE_URL,
+            self._request_headers(),
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            max_concurrency=LLM_MAX_CONCURRENCY,
+            connect_timeout=LLM_CONNECT_TIMEOUT,
+            read_timeout=LLM_READ_TIMEOUT
+        )
+        
+        # Selects, de-duplicates and trims chunks for the prompt
+        self.context_packer = ContextPacker(
+            max_tokens=CONTEXT_MAX_TOKENS,
+            max_chunks=CONTEXT_CHUNKS,
+            max_chunk_tokens=CONTEXT_MAX_CHUNK_TOKENS,
+            duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD,
+            chars_per_token=CONTEXT_CHARS_PER_TOKEN
+        )
+        
+        # Optional cross-encoder rerank stage (see retrieve_many)
+        self.reranker = None
+        if RERANK_ENABLED:
+            self.reranker = Reranker(
+                RERANK_MODEL,
+                batch_size=RERANK_BATCH_SIZE,
+                budget_ms=RERANK_BUDGET_MS,
+                cache_size=RERANK_CACHE_SIZE
+            )
+        
+        # Groups query encodes from concurrent requests into one model call
+        self.embedding_batcher = None
+        if EMBED_BATCH_ENABLED:
+            self.embedding_batcher = EmbeddingBatcher(
+                # Bound to the model, not the pipeline, so a forked pipeline
+                # does not keep the original's indexes alive
+                partial(encode_texts, self.embedding_model),
+                max_batch_size=EMBED_BATCH_MAX_SIZE,
+                max_wait_ms=EMBED_BATCH_MAX_WAIT_MS
+            )
+
+    def _reset_index_state(self):
+        """Forget all loaded or built indexes"""
         self.indexes = {}
         self.metadata = {}
-        self.dimension = 384  # MiniLM embedding dimension
+        # Full-precision vectors for domains with quantized storage, used only
+        # to re-score candidates (np.memmap when loaded from disk)
+        self.vectors = {}
+        # BM25 inverted indexes for hybrid retrieval
+        self.sparse_indexes = {}
+        self.build_stats = {}
+        # Chunks run through the model (not reused) and seconds spent building these indexes
+        self.encode_stats = {"chunks": 0, "seconds": 0.0}
+        # domain -> duplicate removal counts from the last build (see dedup.py)
+        self.dedup_stats: Dict[str, Dict[str, Any]] = {}
+        
+        # Version and directory the indexes were loaded from (see index_versions)
+        self.index_version = None
+        self.index_dir = None
+        # domain -> {source file name: content hash} the indexes were built
+        # from, used by update_index.py to find new and changed files
+        self.source_hashes: Dict[str, Dict[str, str]] = {}
+        
+        # Combined cross-domain index (see build_merged_index)
+        self.merged_index = None
+        self.merged_domains: List[str] = []
+        self.merged_offsets = None
+        self.merged_domain_ids = None
+        self.merged_vectors = None
+    
+    def fork(self) -> "RAGPipeline":
+        """
+        A pipeline with no indexes that shares this one's model, caches and clients
+        
+        Used to load a new index version next to the serving one; requests
+        holding the old pipeline keep using its indexes until they finish.
+        """
+        clone = copy.copy(self)
+        clone._reset_index_state()
+        return clone
     
     def build_index(self, documents: List[Dict[str, Any]], domain: str):
         """
@@ -56,40 +264,456 @@ class RAGPipeline:
         # Extract texts
         texts = [doc["text"] for doc in documents]
         
-        # Generate embeddings
+        # Generate embeddings (normalized for cosine similarity via inner product)
         print(f"  Generating embeddings...")
-        embeddings = self.embedding_model.encode(
-            texts, 
-            convert_to_numpy=True,
-            show_progress_bar=True
-        ).astype('float32')
-        
-        # Normalize for cosine similarity (using IndexFlatIP for inner product)
-        faiss.normalize_L2(embeddings)
+        embeddings = self.embed_chunks(texts, show_progress_bar=True)
         
-        # Create FAISS index
-        index = faiss.IndexFlatIP(self.dimension)
-        index.add(embeddings)
+        # Create FAISS index (exact or approximate, per domain config)
+        index_config = get_index_config(domain)
+        index = create_index(embeddings, index_config)
         
         # Store index and metadata
         self.indexes[domain] = index
         self.metadata[domain] = documents
+        if is_quantized(index_config):
+            self.vectors[domain] = embeddings
+        else:
+            self.vectors.pop(domain, None)
+        
+        storage = index_config.get("storage", "float")
+        print(f"  Index built with {index.ntotal} vectors ({index_config['type']}, {storage})")
+        
+        stats = {
+            "index_type": index_config["type"],
+            "storage": storage,
+            "num_vectors": index.ntotal,
+            "bytes_per_vector": bytes_per_vector(index)
+        }
+        print(f"  Index bytes per vector: {stats['bytes_per_vector']:.1f}")
+        if index_config["type"] != "flat" or is_quantized(index_config):
+            recall = recall_at_k(
+                lambda queries, top_k: self._search_domain(domain, queries, top_k),
+                embeddings, k=10, num_queries=RECALL_CHECK_QUERIES
+            )
+            stats["recall@10"] = recall
+            print(f"  Recall@10 vs exact search: {recall:.3f}")
+        self.build_stats[domain] = stats
         
-        print(f"  Index built with {index.ntotal} vectors")
+        if HYBRID_SEARCH_ENABLED:
+            print(f"  Building BM25 inverted index...")
+            self.sparse_indexes[domain] = SparseIndex.build(texts)
+            print(f"  Inverted index built with {len(self.sparse_indexes[domain].vocab)} terms")
     
-    def build_all_indexes(self, all_documents: Dict[str, List[Dict[str, Any]]]):
-        """Build indexes for all domains"""
+    def embed_chunks(self, texts: List[str], show_progress_bar: bool = False,
+                     batch_size: int = 32) -> np.ndarray:
+        """
+        Embed chunk texts for indexing, reusing the persistent embedding store
+        
+        Only texts whose hash is not yet stored for this model and backend
+        are run through the model; their vectors are then added to the store.
+        
+        Args:
+            texts: Chunk texts
+            show_progress_bar: Show the encoder's progress bar
+            batch_size: Encoder batch size
+            
+        Returns:
+            L2-normalized float32 array of shape (len(texts), dimension)
+        """
+        store = self._get_embedding_store()
+        if store is None:
+            return self._encode_chunks(texts, show_progress_bar, batch_size)
+        
+        hashes = [text_hash(text) for text in texts]
+        embeddings, missing = store.lookup(hashes)
+        if len(texts) > batch_size:
+            print(f"  Embedding store: {len(texts) - len(missing)} reused, {len(missing)} to encode")
+        if missing:
+            new_embeddings = self._encode_chunks(
+                [texts[i] for i in missing],
+                show_progress_bar and len(missing) > batch_size,
+                batch_size
+            )
+            embeddings[missing] = new_embeddings
+            store.add([hashes[i] for i in missing], new_embeddings)
+        return embeddings
+    
+    def _encode_chunks(self, texts: List[str], show_progress_bar: bool, batch_size: int) -> np.ndarray:
+        """
+        Run the model on chunk texts and normalize
+        
+        Large inputs go to the multi-process BulkEncoder; throughput is
+        printed and accumulated in self.encode_stats.
+        """
+        start = datetime.now()
+        if len(texts) >= BULK_ENCODE_MIN_TEXTS and BULK_ENCODE_WORKERS != 1:
+            if self.bulk_encoder is None:
+                self.bulk_encoder = BulkEncoder(
+                    EMBEDDING_MODEL, self.embedding_backend, EMBEDDING_ONNX_FILE,
+                    workers=BULK_ENCODE_WORKERS, batch_size=BULK_ENCODE_BATCH
+                )
+            embeddings = self.bulk_encoder.encode(texts)
+            bulk = self.bulk_encoder.last_stats
+            print(f"  Bulk encode: {bulk['workers']} workers x {bulk['threads_per_worker']} threads, "
+                  f"padding efficiency {bulk['padding_efficiency']:.0%}")
+        else:
+            embeddings = self.embedding_model.encode(
+                texts,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=show_progress_bar
+            ).astype('float32')
+        faiss.normalize_L2(embeddings)
+        
+        elapsed = (datetime.now() - start).total_seconds()
+        self.encode_stats["chunks"] += len(texts)
+        self.encode_stats["seconds"] += elapsed
+        if len(texts) > batch_size:
+            print(f"  Encoded {len(texts)} chunks in {elapsed:.1f}s "
+                  f"({len(texts) / max(elapsed, 1e-6):.0f} chunks/sec)")
+        return embeddings
+    
+    def _get_embedding_store(self) -> Optional[EmbeddingStore]:
+        """Open the embedding store on first use (the API never needs it)"""
+        if self.embedding_store is None and EMBEDDING_STORE_ENABLED:
+            self.embedding_store = EmbeddingStore(
+                EMBEDDING_STORE_DIR, EMBEDDING_MODEL, self.embedding_backend, self.dimension
+            )
+        return self.embedding_store
+    
+    def update_index(self, domain: str, upserts: Dict[str, List[Dict[str, Any]]],
+                     deletes: Iterable[str] = ()) -> Dict[str, int]:
+        """
+        Add, replace or remove a domain's chunks by source file without a full rebuild
+        
+        Rows stay positional (row i of the index is metadata[domain][i]), so
+        chunks are addressed by their "source". Chunks of replaced sources
+        whose text is unchanged reuse their stored vector; only new or edited
+        text is embedded. Pure additions are appended to the index; when rows
+        are removed the index is reset and refilled from stored vectors,
+        keeping any IVF/quantizer training. New chunks that duplicate a kept
+        chunk or each other are dropped first (DEDUP_ENABLED), as in a full
+        build. The BM25 index is rebuilt (tokenizing only), and callers
+        should rebuild the merged index afterwards. Indexes must be loaded
+        with mmap=False.
+        
+        Args:
+            domain: Clinical domain identifier
+            upserts: Source file name -> its complete new list of chunks
+            deletes: Source file names to remove
+            
+        Returns:
+            Counts of removed, added, embedded and reused chunks
+        """
+        new_docs = [doc for docs in upserts.values() for doc in docs]
+        changed = set(upserts) | set(deletes)
+        dedup = self._new_duplicate_filter()
+        if dedup is not None:
+            dedup.seed(doc for doc in self.metadata.get(domain, []) if doc["source"] not in changed)
+            new_docs = dedup.filter(new_docs)
+            self._record_dedup(domain, dedup)
+        stats = {"removed": 0, "added": len(new_docs), "embedded": 0, "reused": 0}
+        
+        if domain not in self.indexes:
+            self.build_index(new_docs, domain)
+            stats["embedded"] = len(new_docs)
+            return stats
+        
+        index = self.indexes[domain]
+        if isinstance(index, faiss.IndexIVF):
+            # Lets _chunk_vector reconstruct individual rows
+            index.make_direct_map()
+        metadata = list(self.metadata[domain])
+        keep_rows = [i for i, doc in enumerate(metadata) if doc["source"] not in changed]
+        stats["removed"] = len(metadata) - len(keep_rows)
+        
+        # Stored vectors of the chunks being replaced, by text
+        reusable = {}
+        for i, doc in enumerate(metadata):
+            if doc["source"] in upserts:
+                vector = self._chunk_vector(domain, i)
+                if vector is not None:
+                    reusable[text_hash(doc["text"])] = vector
+        
+        new_vectors = np.empty((len(new_docs), self.dimension), dtype='float32')
+        missing = []
+        for i, doc in enumerate(new_docs):
+            vector = reusable.get(text_hash(doc["text"]))
+            if vector is None:
+                missing.append(i)
+            else:
+                new_vectors[i] = vector
+        
+        if missing:
+            print(f"  Generating embeddings for {len(missing)} new or changed chunks...")
+            new_vectors[missing] = self.embed_chunks(
+                [new_docs[i]["text"] for i in missing],
+                show_progress_bar=len(missing) > 1000
+            )
+        stats["embedded"] = len(missing)
+        stats["reused"] = len(new_docs) - len(missing)
+        
+        documents = [metadata[i] for i in keep_rows] + new_docs
+        if not documents:
+            print(f"  All chunks removed, dropping index for {domain}")
+            for table in (self.indexes, self.metadata, self.vectors, self.sparse_indexes, self.build_stats):
+                table.pop(domain, None)
+            return stats
+        
+        index_config = get_index_config(domain)
+        if stats["removed"]:
+            kept_vectors = np.asarray(
+                self.vectors[domain] if domain in self.vectors else reconstruct_all(index),
+                dtype='float32'
+            )[keep_rows]
+            vectors = np.vstack([kept_vectors, new_vectors])
+            index.reset()
+            index.add(vectors)
+        else:
+            index.add(new_vectors)
+            vectors = None
+            if domain in self.vectors:
+                vectors = np.vstack([np.asarray(self.vectors[domain], dtype='float32'), new_vectors])
+        
+        self.metadata[domain] = documents
+        if is_quantized(index_config) and vectors is not None:
+            self.vectors[domain] = vectors
+        
+        if HYBRID_SEARCH_ENABLED:
+            self.sparse_indexes[domain] = SparseIndex.build([doc["text"] for doc in documents])
+        
+        print(f"  {domain}: -{stats['removed']} +{stats['added']} chunks "
+              f"({stats['embedded']} embedded, {stats['reused']} reused), {index.ntotal} vectors")
+        return stats
+    
+    def build_all_indexes(self, all_documents: Dict[str, List[Dict[str, Any]]],
+                          source_hashes: Optional[Dict[str, Dict[str, str]]] = None):
+        """
+        Build indexes for all domains, dropping duplicate chunks first (DEDUP_ENABLED)
+        
+        Args:
+            all_documents: Dictionary mapping domain to list of documents
+            source_hashes: File hash of each source as ingested (domain ->
+                source -> SHA-256), saved as sources.json so update_index.py
+                can tell which sources changed since this build
+        """
+        source_hashes = source_hashes or {}
         for domain, documents in all_documents.items():
+            self.source_hashes[domain] = dict(source_hashes.get(domain, {}))
+            dedup = self._new_duplicate_filter()
+            if dedup is not None:
+                documents = dedup.filter(documents)
+                self._record_dedup(domain, dedup)
             self.build_index(documents, domain)
+        self._print_dedup_report()
+        self._print_encode_throughput()
+        
+        if MERGED_INDEX_ENABLED:
+            self.build_merged_index()
     
-    def save_indexes(self):
-        """Save all indexes and metadata to disk"""
+    def build_index_stream(self, document_batches: Iterable[List[Dict[str, Any]]], domain: str,
+                           batch_size: int = STREAM_EMBED_BATCH,
+                           prefetch_batches: int = STREAM_PREFETCH_BATCHES):
+        """
+        Build a domain index from a stream of document batches
+        
+        Batches are pulled through a bounded background queue, so parsing
+        overlaps with embedding and stalls when embedding falls behind.
+        Duplicate chunks are dropped as they arrive (DEDUP_ENABLED), then
+        chunks are embedded batch_size at a time and added to the index. Memory is the index and chunk metadata plus a bounded
+        working set; the recall check of build_index is skipped because it
+        needs every embedding in memory.
+        
+        Args:
+            document_batches: Iterable of document lists, e.g.
+                DataIngestion.iter_domain_documents(domain)
+            domain: Clinical domain identifier
+            batch_size: Chunks per embedding call
+            prefetch_batches: Parsed batches allowed to queue up ahead of embedding
+        """
+        print(f"\nStreaming index build for {domain}...")
+        index_config = get_index_config(domain)
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        builder = StreamingIndexBuilder(self.dimension, index_config, STREAM_TRAIN_SIZE,
+                                        vectors_dir=INDEX_DIR)
+        documents = []
+        start = datetime.now()
+        
+        dedup = self._new_duplicate_filter()
+        parsed = prefetch(document_batches, prefetch_batches)
+        if dedup is not None:
+            # Drop duplicates before they cost an embedding
+            parsed = (dedup.filter(batch) for batch in parsed)
+        
+        try:
+            batches = rebatch(parsed, batch_size)
+            for batch_num, batch in enumerate(batches, 1):
+                embeddings = self.embed_chunks([doc["text"] for doc in batch], batch_size=batch_size)
+                builder.add(embeddings)
+                documents.extend(batch)
+                if batch_num % 20 == 0:
+                    elapsed = (datetime.now() - start).total_seconds()
+                    print(f"  {len(documents)} chunks indexed ({len(documents) / max(elapsed, 1e-6):.0f}/s)")
+            
+            index = builder.finish()
+            vectors = builder.vectors() if index is not None else None
+        finally:
+            # Removes the scratch vectors file unless vectors() took it over
+            builder.close()
+        
+        if dedup is not None:
+            self._record_dedup(domain, dedup)
+        if index is None:
+            print(f"Warning: No documents to index for domain {domain}")
+            return
+        
+        self.indexes[domain] = index
+        self.metadata[domain] = documents
+        if vectors is not None:
+            self.vectors[domain] = vectors
+        else:
+            self.vectors.pop(domain, None)
+        
+        storage = index_config.get("storage", "float")
+        elapsed = (datetime.now() - start).total_seconds()
+        print(f"  Index built with {index.ntotal} vectors ({index_config['type']}, {storage}) "
+              f"in {elapsed:.1f}s")
+        self.build_stats[domain] = {
+            "index_type": index_config["type"],
+            "storage": storage,
+            "num_vectors": index.ntotal,
+            "bytes_per_vector": bytes_per_vector(index)
+        }
+        
+        if HYBRID_SEARCH_ENABLED:
+            print(f"  Building BM25 inverted index...")
+            self.sparse_indexes[domain] = SparseIndex.build([doc["text"] for doc in documents])
+            print(f"  Inverted index built with {len(self.sparse_indexes[domain].vocab)} terms")
+    
+    def build_all_indexes_stream(self, ingestion, domains: Optional[List[str]] = None):
+        """
+        Parse and index every domain in streaming mode (see build_index_stream)
+        
+        Args:
+            ingestion: DataIngestion used to parse the source files
+            domains: Domains to build (default: all)
+        """
+        ingestion.failures = []
+        ingestion.source_hashes = {}
+        for domain in domains or list(DOMAINS):
+            self.build_index_stream(ingestion.iter_domain_documents(domain), domain)
+            self.source_hashes[domain] = dict(ingestion.source_hashes.get(domain, {}))
+        ingestion.write_failure_report()
+        self._print_dedup_report()
+        self._print_encode_throughput()
+        
+        if MERGED_INDEX_ENABLED:
+            self.build_merged_index()
+    
+    def _new_duplicate_filter(self) -> Optional[DuplicateFilter]:
+        if not DEDUP_ENABLED:
+            return None
+        return DuplicateFilter(
+            threshold=DEDUP_NEAR_THRESHOLD,
+            shingle_words=DEDUP_SHINGLE_WORDS,
+            num_perm=DEDUP_NUM_PERM,
+            bands=DEDUP_BANDS
+        )
+    
+    def _record_dedup(self, domain: str, dedup: DuplicateFilter):
+        self.dedup_stats[domain] = dedup.report()
+        stats = self.dedup_stats[domain]
+        print(f"  Dedup {domain}: {stats['input']} -> {stats['kept']} chunks "
+              f"({stats['exact']} exact, {stats['near']} near duplicates, "
+              f"-{stats['reduction']:.1%})")
+    
+    def _print_dedup_report(self):
+        if not self.dedup_stats:
+            return
+        print(f"\nDuplicate removal (near threshold {DEDUP_NEAR_THRESHOLD}):")
+        print(f"  {'domain':<16}{'input':>9}{'exact':>9}{'near':>9}{'kept':>9}{'reduction':>11}")
+        for domain, stats in self.dedup_stats.items():
+            print(f"  {domain:<16}{stats['input']:>9}{stats['exact']:>9}{stats['near']:>9}"
+                  f"{stats['kept']:>9}{stats['reduction']:>11.1%}")
+    
+    def _print_encode_throughput(self):
+        chunks, seconds = self.encode_stats["chunks"], self.encode_stats["seconds"]
+        if chunks:
+            print(f"\nEncoded {chunks} chunks in {seconds:.1f}s ({chunks / max(seconds, 1e-6):.0f} chunks/sec)")
+    
+    def build_merged_index(self):
+        """
+        Build one combined index over every loaded domain
+        
+        Vectors are laid out domain by domain, so each domain owns a contiguous
+        ID range [offsets[i], offsets[i+1]) and merged position p maps back to
+        metadata[domain][p - offset]. A per-vector domain-id array is kept for
+        lookups.
+        """
+        domains = [d for d in DOMAINS if d in self.indexes]
+        if not domains:
+            print("Warning: No domain indexes to merge")
+            return
+        
+        print(f"\nBuilding merged index over {len(domains)} domains...")
+        
+        sizes = [self.indexes[d].ntotal for d in domains]
+        # Prefer the exact float vectors over (possibly lossy) reconstruction
+        vectors = np.vstack([
+            self.vectors[d] if d in self.vectors else reconstruct_all(self.indexes[d])
+            for d in domains
+        ]).astype('float32')
+        
+        index_config = get_index_config()
+        index = create_index(vectors, index_config)
+        
+        self._set_merged_index(
+            index,
+            domains,
+            np.cumsum([0] + sizes).astype('int64'),
+            vectors if is_quantized(index_config) else None
+        )
+        
+        print(f"  Merged index built with {index.ntotal} vectors")
+    
+    def _set_merged_index(self, index, domains: List[str], offsets: np.ndarray,
+                          vectors: Optional[np.ndarray] = None):
+        """Install a merged index and derive its domain-id array"""
+        sizes = np.diff(offsets)
+        self.merged_index = index
+        self.merged_vectors = vectors
+        self.merged_domains = list(domains)
+        self.merged_offsets = offsets
+        self.merged_domain_ids = np.repeat(
+            np.arange(len(domains), dtype='int16'), sizes
+        )
+    
+    def save_indexes(self, version: Optional[str] = None) -> str:
+        """
+        Save all indexes and metadata to disk
+        
+        With INDEX_VERSIONING the files go to a new version directory that
+        becomes the active version once everything is written; otherwise
+        they overwrite the flat INDEX_DIR layout.
+        
+        Args:
+            version: Version name (default: timestamp)
+            
+        Returns:
+            The version written
+        """
+        if INDEX_VERSIONING:
+            version = version or new_version()
+        else:
+            version = UNVERSIONED
+        index_dir = version_dir(version)
+        os.makedirs(index_dir, exist_ok=True)
+        
         for domain in self.indexes.keys():
-            domain_config = DOMAINS[domain]
+            domain_config = domain_paths(domain, index_dir)
             
             # Save FAISS index
             index_path = domain_config["index_path"]
-            os.makedirs(os.path.dirname(index_path), exist_ok=True)
             faiss.write_index(self.indexes[domain], index_path)
             
             # Save metadata
@@ -97,25 +721,238 @@ class RAGPipeline:
             with open(metadata_path, 'wb') as f:
                 pickle.dump(self.metadata[domain], f)
             
+            # Save memory-mapped serving copy of the metadata
+            write_metadata(self.metadata[domain], domain_config["serving_path"])
+            
+            if domain in self.sparse_indexes:
+                self.sparse_indexes[domain].save(domain_config["sparse_path"])
+            
+            # Save float vectors used for re-scoring quantized indexes
+            if domain in self.vectors:
+                np.save(domain_config["vectors_path"], self.vectors[domain])
+            
             print(f"Saved index for {domain} to {index_path}")
+        
+        if self.merged_index is not None:
+            paths = merged_paths(index_dir)
+            faiss.write_index(self.merged_index, paths["index_path"])
+            with open(paths["metadata_path"], 'wb') as f:
+                pickle.dump({
+                    "domains": self.merged_domains,
+                    "offsets": self.merged_offsets
+                }, f)
+            if self.merged_vectors is not None:
+                np.save(paths["vectors_path"], self.merged_vectors)
+            print(f"Saved merged index to {paths['index_path']}")
+        
+        if self.source_hashes:
+            with open(os.path.join(index_dir, SOURCES_FILE), 'w') as f:
+                json.dump(self.source_hashes, f, indent=1, sort_keys=True)
+        
+        if version != UNVERSIONED:
+            publish_version(version, keep=INDEX_VERSIONS_KEEP)
+            print(f"Published index version {version}")
+        
+        self.index_version = version
+        self.index_dir = index_dir
+        return version
     
-    def load_indexes(self):
-        """Load all indexes and metadata from disk"""
-        for domain, domain_config in DOMAINS.items():
+    def load_indexes(self, version: Optional[str] = None, mmap: bool = INDEX_MMAP):
+        """
+        Load all indexes and metadata from disk
+        
+        Args:
+            version: Index version to load (default: the active version, or
+                the flat INDEX_DIR layout if none has been published)
+            mmap: Memory-map read-only files (serving); pass False to load
+                writable copies for update_index
+        """
+        self.index_version, self.index_dir = resolve_version(version)
+        print(f"Loading index version {self.index_version} from {self.index_dir}")
+        
+        sources_path = os.path.join(self.index_dir, SOURCES_FILE)
+        if os.path.exists(sources_path):
+            with open(sources_path) as f:
+                self.source_hashes = json.load(f)
+        
+        for domain in DOMAINS:
+            domain_config = domain_paths(domain, self.index_dir)
             index_path = domain_config["index_path"]
             metadata_path = domain_config["metadata_path"]
             
             if os.path.exists(index_path) and os.path.exists(metadata_path):
                 # Load FAISS index
-                self.indexes[domain] = faiss.read_index(index_path)
+                index_config = get_index_config(domain)
+                self.indexes[domain] = read_index(index_path, index_config, mmap=mmap)
+                
+                if is_quantized(index_config):
+                    vectors = self._load_vectors(domain_config["vectors_path"])
+                    if vectors is not None:
+                        self.vectors[domain] = vectors
                 
                 # Load metadata
-                with open(metadata_path, 'rb') as f:
-                    self.metadata[domain] = pickle.load(f)
+                serving_path = domain_config["serving_path"]
+                if mmap and has_metadata(serving_path):
+                    self.metadata[domain] = MappedMetadata(serving_path)
+                else:
+                    with open(metadata_path, 'rb') as f:
+                        self.metadata[domain] = pickle.load(f)
+                
+                if HYBRID_SEARCH_ENABLED:
+                    sparse_index = SparseIndex.load(domain_config["sparse_path"], mmap=mmap)
+                    if sparse_index is not None:
+                        self.sparse_indexes[domain] = sparse_index
+                    else:
+                        print(f"Warning: BM25 index not found for {domain}, using dense retrieval only")
                 
                 print(f"Loaded index for {domain}: {self.indexes[domain].ntotal} vectors")
             else:
                 print(f"Warning: Index files not found for {domain}")
+        
+        if MERGED_INDEX_ENABLED:
+            self._load_merged_index(mmap)
+    
+    def _load_merged_index(self, mmap: bool = INDEX_MMAP):
+        """Load the merged index if it matches the loaded domain metadata"""
+        paths = merged_paths(self.index_dir)
+        if not (os.path.exists(paths["index_path"]) and os.path.exists(paths["metadata_path"])):
+            print("Warning: Merged index not found, searching domains separately")
+            return
+        
+        index = read_index(paths["index_path"], get_index_config(), mmap=mmap)
+        with open(paths["metadata_path"], 'rb') as f:
+            merged_meta = pickle.load(f)
+        
+        domains = merged_meta["domains"]
+        offsets = np.asarray(merged_meta["offsets"], dtype='int64')
+        
+        # A merged index built from different domain files would map IDs to
+        # the wrong chunks, so refuse it rather than serve bad sources
+        stale = [
+            d for i, d in enumerate(domains)
+            if d not in self.metadata
+            or len(self.metadata[d]) != offsets[i + 1] - offsets[i]
+        ]
+        if stale or index.ntotal != offsets[-1]:
+            print(f"Warning: Merged index is out of date ({stale or 'size mismatch'}), "
+                  f"searching domains separately")
+            return
+        
+        vectors = None
+        if is_quantized(get_index_config()):
+            vectors = self._load_vectors(paths["vectors_path"])
+        
+        self._set_merged_index(index, domains, offsets, vectors)
+        print(f"Loaded merged index: {index.ntotal} vectors across {len(domains)} domains")
+    
+    def encode_query(self, query: str) -> np.ndarray:
+        """
+        Embed a query, reusing cached vectors for repeated questions
+        
+        Args:
+            query: User query
+            
+        Returns:
+            L2-normalized float32 array of shape (1, dimension)
+        """
+        return self.encode_queries([query])
+    
+    def _load_embedding_model(self):
+        """
+        Load the embedding model on the configured backend
+        
+        With EMBEDDING_PARITY_CHECK on, a non-PyTorch backend is compared with
+        the PyTorch model at startup and replaced by it if any cosine
+        similarity falls below EMBEDDING_PARITY_THRESHOLD, since the indexes
+        may have been built with either.
+        """
+        model = load_embedding_model(EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_ONNX_FILE)
+        if EMBEDDING_BACKEND == "torch" or not EMBEDDING_PARITY_CHECK:
+            return model
+        
+        reference = load_embedding_model(EMBEDDING_MODEL, "torch")
+        parity = check_parity(model, reference, PARITY_TEXTS, EMBEDDING_PARITY_THRESHOLD)
+        logger.info(f"🔬 Embedding parity ({EMBEDDING_BACKEND} vs torch): "
+                    f"min cosine {parity['min_cosine']:.5f}, mean {parity['mean_cosine']:.5f}")
+        if parity["passed"]:
+            return model
+        
+        logger.error(f"❌ {EMBEDDING_BACKEND} embeddings below parity threshold "
+                     f"{EMBEDDING_PARITY_THRESHOLD}, falling back to torch")
+        self.embedding_backend = "torch"
+        return reference
+    
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embed several queries, encoding all cache misses in one model call
+        
+        Args:
+            queries: User queries
+            
+        Returns:
+            L2-normalized float32 array of shape (len(queries), dimension)
+        """
+        query_embeddings = np.empty((len(queries), self.dimension), dtype='float32')
+        
+        missing = []
+        for i, query in enumerate(queries):
+            cached = self.query_cache.get(query)
+            if cached is not None:
+                query_embeddings[i] = cached
+            else:
+                missing.append(i)
+        
+        if missing:
+            texts = [queries[i] for i in missing]
+            if self.embedding_batcher is not None:
+                new_embeddings = self.embedding_batcher.encode(texts)
+            else:
+                new_embeddings = self._encode_texts(texts)
+            
+            # Normalize for cosine similarity
+            faiss.normalize_L2(new_embeddings)
+            
+            for i, embedding in zip(missing, new_embeddings):
+                query_embeddings[i] = embedding
+                self.query_cache.put(queries[i], embedding)
+        
+        return query_embeddings
+    
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Run the embedding model on a list of query texts"""
+        return encode_texts(self.embedding_model, texts)
+    
+    def _load_vectors(self, vectors_path: str) -> Optional[np.ndarray]:
+        """Memory-map re-scoring vectors so only touched rows become resident"""
+        if not os.path.exists(vectors_path):
+            print(f"Warning: {vectors_path} not found, quantized scores will not be re-scored")
+            return None
+        return np.load(vectors_path, mmap_mode='r')
+    
+    def _search_index(self, index, vectors: Optional[np.ndarray], query_embedding: np.ndarray,
+                      k: int, index_config: Dict[str, Any], params=None):
+        """
+        Search an index, re-scoring quantized candidates with exact float vectors
+        
+        Returns:
+            (scores, ids) arrays as returned by faiss
+        """
+        if vectors is None:
+            return index.search(query_embedding, k, params=params)
+        
+        fetch = k * int(index_config.get("rescore_factor", 4))
+        _, candidates = index.search(query_embedding, fetch, params=params)
+        return rescore(vectors, query_embedding, candidates, k)
+    
+    def _search_domain(self, domain: str, query_embedding: np.ndarray, k: int):
+        """Search one domain index"""
+        return self._search_index(
+            self.indexes[domain],
+            self.vectors.get(domain),
+            query_embedding,
+            k,
+            get_index_config(domain)
+        )
     
     def retrieve(self, query: str, domain: Optional[str] = None, k: int = TOP_K_RESULTS) -> List[Dict[str, Any]]:
         """
@@ -129,16 +966,73 @@ class RAGPipeline:
         Returns:
             List of relevant documents with scores
         """
-        # Generate query embedding
-        query_embedding = self.embedding_model.encode(
-            [query], 
-            convert_to_numpy=True
-        ).astype('float32')
+        return self.retrieve_many([query], domain, k)[0]
+    
+    def retrieve_many(self, queries: List[str], domain: Optional[str] = None,
+                      k: int = TOP_K_RESULTS) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve relevant documents for several queries at once
         
-        # Normalize for cosine similarity
-        faiss.normalize_L2(query_embedding)
+        All queries are encoded in one model call and each index is searched
+        once with a multi-row query matrix. With reranking enabled, a wider
+        candidate set is retrieved and reranked down to k per query.
+        
+        Args:
+            queries: User queries
+            domain: Specific domain to search (None for all domains)
+            k: Number of top results to retrieve per query
+            
+        Returns:
+            One list of relevant documents with scores per query, in input order
+        """
+        if not queries:
+            return []
         
-        all_results = []
+        if self.reranker is not None:
+            candidates = self._retrieve_candidates(queries, domain, max(k, RERANK_CANDIDATES))
+            return [
+                self.reranker.rerank(query, docs, k)
+                for query, docs in zip(queries, candidates)
+            ]
+        
+        return self._retrieve_candidates(queries, domain, k)
+    
+    def _retrieve_candidates(self, queries: List[str], domain: Optional[str],
+                             k: int) -> List[List[Dict[str, Any]]]:
+        """Dense (and optionally hybrid) retrieval of the top k per query"""
+        # Generate (or reuse) query embeddings
+        query_embeddings = self.encode_queries(queries)
+        
+        hybrid = HYBRID_SEARCH_ENABLED and bool(self.sparse_indexes)
+        dense_k = max(k, HYBRID_CANDIDATES) if hybrid else k
+        
+        if self.merged_index is not None:
+            all_hits = self._search_merged(query_embeddings, domain, dense_k)
+        else:
+            all_hits = self._search_domains(query_embeddings, domain, dense_k)
+        
+        if hybrid:
+            return [
+                self._fuse_hybrid(query, query_embedding, hits, domain, k)
+                for query, query_embedding, hits in zip(queries, query_embeddings, all_hits)
+            ]
+        
+        return [
+            [self._materialize(d, idx, {"similarity_score": score}) for d, idx, score in hits[:k]]
+            for hits in all_hits
+        ]
+    
+    def _materialize(self, domain: str, idx: int, scores: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy a chunk's metadata and attach its scores and row in the domain index"""
+        result = self.metadata[domain][idx].copy()
+        result.update(scores)
+        result["vector_id"] = idx
+        return result
+    
+    def _search_domains(self, query_embeddings: np.ndarray, domain: Optional[str],
+                        k: int) -> List[List[Tuple[str, int, float]]]:
+        """Search each domain index and merge the hits per query"""
+        all_hits = [[] for _ in range(len(query_embeddings))]
         
         # Search in specified domain or all domains
         domains_to_search = [domain] if domain else list(self.indexes.keys())
@@ -147,46 +1041,260 @@ class RAGPipeline:
             if search_domain not in self.indexes:
                 continue
             
-            index = self.indexes[search_domain]
-            metadata = self.metadata[search_domain]
+            num_docs = len(self.metadata[search_domain])
             
             # Search
-            scores, indices = index.search(query_embedding, k)
+            scores, indices = self._search_domain(search_domain, query_embeddings, k)
             
             # Collect results
-            for score, idx in zip(scores[0], indices[0]):
-                if idx < len(metadata) and score >= MIN_SIMILARITY_SCORE:
-                    result = metadata[idx].copy()
-                    result["similarity_score"] = float(score)
-                    all_results.append(result)
+            for hits, row_scores, row_indices in zip(all_hits, scores, indices):
+                for score, idx in zip(row_scores, row_indices):
+                    if 0 <= idx < num_docs and score >= MIN_SIMILARITY_SCORE:
+                        hits.append((search_domain, int(idx), float(score)))
         
         # Sort by score and return top k
-        all_results.sort(key=lambda x: x["similarity_score"], reverse=True)
-        return all_results[:k]
+        for hits in all_hits:
+            hits.sort(key=lambda hit: hit[2], reverse=True)
+        return [hits[:k] for hits in all_hits]
+    
+    def _search_merged(self, query_embeddings: np.ndarray, domain: Optional[str],
+                       k: int) -> List[List[Tuple[str, int, float]]]:
+        """Single search over the merged index, restricted to a domain's ID range if given"""
+        params = None
+        if domain is not None:
+            if domain not in self.merged_domains:
+                return [[] for _ in range(len(query_embeddings))]
+            pos = self.merged_domains.index(domain)
+            selector = faiss.IDSelectorRange(
+                int(self.merged_offsets[pos]),
+                int(self.merged_offsets[pos + 1])
+            )
+            params = search_parameters(self.merged_index, selector)
+        
+        scores, indices = self._search_index(
+            self.merged_index,
+            self.merged_vectors,
+            query_embeddings,
+            k,
+            get_index_config(),
+            params=params
+        )
+        
+        all_hits = []
+        for row_scores, row_indices in zip(scores, indices):
+            hits = []
+            for score, idx in zip(row_scores, row_indices):
+                if idx < 0 or score < MIN_SIMILARITY_SCORE:
+                    continue
+                domain_pos = int(self.merged_domain_ids[idx])
+                local_idx = int(idx - self.merged_offsets[domain_pos])
+                hits.append((self.merged_domains[domain_pos], local_idx, float(score)))
+            # FAISS already returns hits in descending score order
+            all_hits.append(hits)
+        
+        return all_hits
+    
+    def _fuse_hybrid(self, query: str, query_embedding: np.ndarray, dense_hits: List[Tuple[str, int, float]],
+                     domain: Optional[str], k: int) -> List[Dict[str, Any]]:
+        """
+        Combine dense hits with BM25 hits from the sparse indexes
+        
+        Dense candidates are filtered by MIN_SIMILARITY_SCORE as usual; BM25-only
+        hits bypass that filter since they matched the query terms literally.
+        """
+        domains_to_search = [domain] if domain else list(self.sparse_indexes.keys())
+        
+        sparse_hits = []
+        for search_domain in domains_to_search:
+            sparse_index = self.sparse_indexes.get(search_domain)
+            if sparse_index is None:
+                continue
+            for idx, score in sparse_index.search(query, HYBRID_CANDIDATES):
+                sparse_hits.append((search_domain, idx, score))
+        sparse_hits.sort(key=lambda hit: hit[2], reverse=True)
+        sparse_hits = sparse_hits[:HYBRID_CANDIDATES]
+        
+        fused = fuse_rankings(
+            dense_hits,
+            sparse_hits,
+            method=HYBRID_FUSION,
+            rrf_k=HYBRID_RRF_K,
+            dense_weight=HYBRID_DENSE_WEIGHT
+        )[:k]
+        
+        dense_scores = {(d, idx): score for d, idx, score in dense_hits}
+        sparse_scores = {(d, idx): score for d, idx, score in sparse_hits}
+        
+        results = []
+        for (d, idx), fused_score in fused:
+            similarity = dense_scores.get((d, idx))
+            if similarity is None:
+                similarity = self._dense_score(d, idx, query_embedding)
+            results.append(self._materialize(d, idx, {
+                "similarity_score": similarity,
+                "bm25_score": sparse_scores.get((d, idx), 0.0),
+                "fusion_score": fused_score
+            }))
+        return results
+    
+    def _dense_score(self, domain: str, idx: int, query_embedding: np.ndarray) -> float:
+        """Cosine similarity of a BM25-only hit, 0.0 if its vector cannot be read back"""
+        vector = self._chunk_vector(domain, idx)
+        if vector is None:
+            return 0.0
+        return float(np.dot(vector, query_embedding))
+    
+    def _chunk_vector(self, domain: str, idx: int) -> Optional[np.ndarray]:
+        """Stored embedding of a chunk, or None if the index cannot reconstruct it"""
+        if domain in self.vectors:
+            return np.asarray(self.vectors[domain][idx], dtype='float32')
+        if domain not in self.indexes:
+            return None
+        try:
+            return self.indexes[domain].reconstruct(int(idx))
+        except RuntimeError:
+            # e.g. IVF indexes without a direct map
+            return None
+    
+    def pack_context(self, retrieved_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Choose the chunks (and text) sent to the LLM within CONTEXT_MAX_TOKENS
+        
+        Near-duplicates are detected from the embeddings already stored in
+        the indexes; chunks whose vector cannot be read back are only checked
+        for identical text.
+        
+        Args:
+            retrieved_docs: Retrieved documents, best first
+            
+        Returns:
+            Packed copies of the selected documents
+        """
+        if not retrieved_docs:
+            return []
+        
+        vectors = np.zeros((len(retrieved_docs), self.dimension), dtype='float32')
+        for row, doc in enumerate(retrieved_docs):
+            if "vector_id" in doc:
+                vector = self._chunk_vector(doc["domain"], doc["vector_id"])
+                if vector is not None:
+                    vectors[row] = vector
+        
+        packed, stats = self.context_packer.pack(retrieved_docs, vectors)
+        logger.info(f"📦 Context tokens: {stats['tokens_before']} -> {stats['tokens_after']} "
+                    f"({len(packed)} chunks, {stats['duplicates']} near-duplicates dropped, "
+                    f"{stats['trimmed']} trimmed)")
+        return packed
+    
+    def _cache_lookup(self, query: str, context_docs: List[Dict[str, Any]]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Check the response cache
+        
+        Args:
+            query: User query
+            context_docs: Packed chunks that would be sent to the LLM
+        
+        Returns:
+            (cache_key, cached_result); cache_key is None when caching is off
+        """
+        if self.response_cache is None or not context_docs:
+            return None, None
+        
+        # Packing limits and the index version are part of the version. The
+        # key also hashes the packed text itself: with INDEX_VERSIONING off
+        # the version stays "unversioned", and an update that edits a chunk
+        # in place must not serve answers built on the old text
+        cache_key = make_response_key(
+            query,
+            context_docs,
+            OPENROUTER_MODEL,
+            f"{PROMPT_VERSION}:{CONTEXT_MAX_TOKENS}:{CONTEXT_MAX_CHUNK_TOKENS}:{self.index_version}"
+        )
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"⚡ Response cache hit for query: {query[:100]}")
+        return cache_key, cached
+    
+    def _cache_store(self, cache_key: Optional[str], result: Dict[str, Any]) -> Dict[str, Any]:
+        """Cache a fresh result (errors and time-outs excluded so the next request retries)"""
+        if cache_key is not None and result["confidence"] != "error":
+            self.response_cache.put(cache_key, result)
+        result["cached"] = False
+        return result
+    
+    async def _acache_lookup(self, query: str,
+                             context_docs: List[Dict[str, Any]]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """_cache_lookup for async callers; disk-backed caches are read off the event loop"""
+        if self.response_cache is not None and self.response_cache.backend == "sqlite":
+            return await asyncio.to_thread(self._cache_lookup, query, context_docs)
+        return self._cache_lookup(query, context_docs)
+    
+    async def _acache_store(self, cache_key: Optional[str], result: Dict[str, Any]) -> Dict[str, Any]:
+        """_cache_store for async callers; disk-backed caches are written off the event loop"""
+        if self.response_cache is not None and self.response_cache.backend == "sqlite":
+            return await asyncio.to_thread(self._cache_store, cache_key, result)
+        return self._cache_store(cache_key, result)
     
     def generate_response(self, query: str, retrieved_docs: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
-        Generate response using OpenRouter LLM
+        Generate response using OpenRouter LLM, reusing cached answers
+        
+        Answers are cached on the normalized query, the chunks used as context
+        and the model/prompt version, so a repeated question over the same
+        evidence skips the LLM call. This blocking variant is meant for scripts;
+        the API uses agenerate_response.
         
         Args:
             query: User query
             retrieved_docs: List of retrieved documents
             
         Returns:
-            Dictionary with response and metadata
+            Dictionary with response and metadata ("cached" marks cache hits)
         """
-        if not retrieved_docs:
-            return {
-                "response": "I couldn't find sufficient information in the provided datasets to answer your question. Please try rephrasing your query or ask about a different topic within the clinical domains (COVID, Diabetes/Heart Attack, or Knee Injuries).",
-                "sources": [],
-                "confidence": "low"
-            }
+        context_docs = self.pack_context(retrieved_docs)
+        cache_key, cached = self._cache_lookup(query, context_docs)
+        if cached is not None:
+            cached["cached"] = True
+            return cached
         
+        return self._cache_store(cache_key, self._generate_uncached(query, retrieved_docs, context_docs))
+    
+    async def agenerate_response(self, query: str, retrieved_docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Non-blocking generate_response over the pooled async HTTP client
+        
+        Args:
+            query: User query
+            retrieved_docs: List of retrieved documents
+            
+        Returns:
+            Dictionary with response and metadata ("cached" marks cache hits)
+        """
+        context_docs = self.pack_context(retrieved_docs)
+        cache_key, cached = await self._acache_lookup(query, context_docs)
+        if cached is not None:
+            cached["cached"] = True
+            return cached
+        
+        result = await self._agenerate_uncached(query, retrieved_docs, context_docs)
+        return await self._acache_store(cache_key, result)
+    
+    def _build_prompt(self, query: str, context_docs: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Build the LLM prompt and the evidence list shown to the user
+        
+        Args:
+            query: User query
+            context_docs: Packed chunks (see pack_context)
+        
+        Returns:
+            (prompt, sources)
+        """
         # Build context from retrieved documents
         context_blocks = []
         sources = []
         
-        for i, doc in enumerate(retrieved_docs[:5]):  # Top 5 for evidence
+        for i, doc in enumerate(context_docs):
             source_info = f"[Source {i+1}: {doc['source']}, Page {doc['page']}]"
             context_blocks.append(f"{source_info}\n{doc['text']}\n")
             
@@ -217,105 +1325,314 @@ Question: {query}
 
 Answer (cite sources and be concise):"""
         
-        # Call OpenRouter API
-        try:
-            headers = {
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://clinical-ai-assistant.local",
-                "X-Title": "Clinical AI Assistant"
-            }
+        return prompt, sources
+    
+    def _request_headers(self) -> Dict[str, str]:
+        """HTTP headers for OpenRouter"""
+        return {
+            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://clinical-ai-assistant.local",
+            "X-Title": "Clinical AI Assistant"
+        }
+    
+    def _request_payload(self, prompt: str, stream: bool = False) -> Dict[str, Any]:
+        """Chat completion request body for OpenRouter"""
+        payload = {
+            "model": OPENROUTER_MODEL,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "You are a helpful medical AI assistant that only uses provided context to answer questions."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "temperature": 0.3,
+            "max_tokens": 1000
+        }
+        if stream:
+            payload["stream"] = True
+            # Ask for token usage in the final streamed chunk
+            payload["usage"] = {"include": True}
+        return payload
+    
+    @staticmethod
+    def _confidence(retrieved_docs: List[Dict[str, Any]]) -> str:
+        return "high" if len(retrieved_docs) >= 3 else "medium"
+    
+    def _log_request(self, query: str, retrieved_docs: List[Dict[str, Any]], prompt: str):
+        logger.info(f"🚀 OpenRouter API Call:")
+        logger.info(f"   Model: {OPENROUTER_MODEL}")
+        logger.info(f"   Query: {query[:100]}...")
+        logger.info(f"   Context docs: {len(retrieved_docs)}")
+        logger.info(f"   Prompt length: {len(prompt)} chars (~{estimate_tokens(prompt, CONTEXT_CHARS_PER_TOKEN)} tokens)")
+    
+    def _handle_completion(self, response, elapsed: float, sources: List[Dict[str, Any]],
+                           retrieved_docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Turn an OpenRouter HTTP response (requests or httpx) into a result dict"""
+        if response.status_code == 200:
+            result = response.json()
+            answer = result["choices"][0]["message"]["content"]
             
-            payload = {
-                "model": OPENROUTER_MODEL,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are a helpful medical AI assistant that only uses provided context to answer questions."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "temperature": 0.3,
-                "max_tokens": 1000
-            }
+            # Log successful response
+            logger.info(f"✅ OpenRouter Response:")
+            logger.info(f"   Status: 200 OK")
+            logger.info(f"   Response time: {elapsed:.2f}s")
+            logger.info(f"   Response length: {len(answer)} chars")
+            
+            # Log usage if available
+            if "usage" in result:
+                usage = result["usage"]
+                logger.info(f"   Token usage: {usage.get('total_tokens', 'N/A')} "
+                          f"(prompt: {usage.get('prompt_tokens', 'N/A')}, "
+                          f"completion: {usage.get('completion_tokens', 'N/A')})")
             
-            # Log OpenRouter request
-            logger.info(f"🚀 OpenRouter API Call:")
-            logger.info(f"   Model: {OPENROUTER_MODEL}")
-            logger.info(f"   Query: {query[:100]}...")
-            logger.info(f"   Context docs: {len(retrieved_docs)}")
-            logger.info(f"   Prompt length: {len(prompt)} chars")
+            # Log cost if available
+            if "cost" in result:
+                logger.info(f"   Cost: ${result['cost']:.6f}")
             
+            return {
+                "response": answer,
+                "sources": sources,
+                "confidence": self._confidence(retrieved_docs)
+            }
+        
+        # Log error response
+        logger.error(f"❌ OpenRouter Error:")
+        logger.error(f"   Status: {response.status_code}")
+        logger.error(f"   Response time: {elapsed:.2f}s")
+        logger.error(f"   Error: {response.text[:200]}")
+        
+        return {
+            "response": f"Error generating response: {response.status_code}",
+            "sources": sources,
+            "confidence": "error"
+        }
+    
+    @staticmethod
+    def _timeout_result(sources: List[Dict[str, Any]]) -> Dict[str, Any]:
+        logger.error(f"❌ OpenRouter Timeout:")
+        logger.error(f"   Request exceeded {LLM_READ_TIMEOUT:.0f} seconds")
+        return {
+            "response": "Error: Request timed out. Please try again.",
+            "sources": sources,
+            "confidence": "error"
+        }
+    
+    @staticmethod
+    def _exception_result(e: Exception, sources: List[Dict[str, Any]]) -> Dict[str, Any]:
+        logger.error(f"❌ OpenRouter Exception:")
+        logger.error(f"   Error: {str(e)}")
+        logger.exception("Full traceback:")
+        return {
+            "response": f"Error calling LLM: {str(e)}",
+            "sources": sources,
+            "confidence": "error"
+        }
+    
+    def _generate_uncached(self, query: str, retrieved_docs: List[Dict[str, Any]],
+                           context_docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the prompt and call OpenRouter (blocking)"""
+        if not context_docs:
+            return {
+                "response": NO_CONTEXT_RESPONSE,
+                "sources": [],
+                "confidence": "low"
+            }
+        
+        prompt, sources = self._build_prompt(query, context_docs)
+        
+        # Call OpenRouter API
+        try:
+            self._log_request(query, context_docs, prompt)
             start_time = datetime.now()
             
             response = requests.post(
                 OPENROUTER_BASE_URL,
-                headers=headers,
-                json=payload,
-                timeout=30
+                headers=self._request_headers(),
+                json=self._request_payload(prompt),
+                timeout=(LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT)
             )
             
             elapsed = (datetime.now() - start_time).total_seconds()
-            
-            if response.status_code == 200:
-                result = response.json()
-                answer = result["choices"][0]["message"]["content"]
-                
-                # Log successful response
-                logger.info(f"✅ OpenRouter Response:")
-                logger.info(f"   Status: 200 OK")
-                logger.info(f"   Response time: {elapsed:.2f}s")
-                logger.info(f"   Response length: {len(answer)} chars")
-                
-                # Log usage if available
-                if "usage" in result:
-                    usage = result["usage"]
-                    logger.info(f"   Token usage: {usage.get('total_tokens', 'N/A')} "
-                              f"(prompt: {usage.get('prompt_tokens', 'N/A')}, "
-                              f"completion: {usage.get('completion_tokens', 'N/A')})")
-                
-                # Log cost if available
-                if "cost" in result:
-                    logger.info(f"   Cost: ${result['cost']:.6f}")
-                
-                return {
-                    "response": answer,
-                    "sources": sources,
-                    "confidence": "high" if len(retrieved_docs) >= 3 else "medium"
-                }
-            else:
-                # Log error response
-                logger.error(f"❌ OpenRouter Error:")
-                logger.error(f"   Status: {response.status_code}")
-                logger.error(f"   Response time: {elapsed:.2f}s")
-                logger.error(f"   Error: {response.text[:200]}")
-                
-                return {
-                    "response": f"Error generating response: {response.status_code}",
-                    "sources": sources,
-                    "confidence": "error"
-                }
+            return self._handle_completion(response, elapsed, sources, retrieved_docs)
                 
         except requests.exceptions.Timeout:
-            logger.error(f"❌ OpenRouter Timeout:")
-            logger.error(f"   Request exceeded 30 seconds")
+            return self._timeout_result(sources)
+        except Exception as e:
+            return self._exception_result(e, sources)
+    
+    async def _agenerate_uncached(self, query: str, retrieved_docs: List[Dict[str, Any]],
+                                  context_docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the prompt and call OpenRouter through the pooled async client"""
+        if not context_docs:
             return {
-                "response": "Error: Request timed out. Please try again.",
-                "sources": sources,
-                "confidence": "error"
+                "response": NO_CONTEXT_RESPONSE,
+                "sources": [],
+                "confidence": "low"
             }
+        
+        prompt, sources = self._build_prompt(query, context_docs)
+        
+        try:
+            self._log_request(query, context_docs, prompt)
+            start_time = datetime.now()
+            
+            response = await self.llm_client.post(self._request_payload(prompt))
+            
+            elapsed = (datetime.now() - start_time).total_seconds()
+            return self._handle_completion(response, elapsed, sources, retrieved_docs)
+        
+        except httpx.TimeoutException:
+            return self._timeout_result(sources)
+        except Exception as e:
+            return self._exception_result(e, sources)
+    
+    @staticmethod
+    def _parse_stream_line(line: str) -> Optional[Dict[str, Any]]:
+        """
+        Decode one line of OpenRouter's SSE stream
+        
+        Returns:
+            The JSON chunk, {"done": True} at the end marker, or None for blank
+            separators and ": OPENROUTER PROCESSING" keep-alive comments
+        """
+        if not line or not line.startswith("data:"):
+            return None
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return {"done": True}
+        return json.loads(data)
+    
+    async def astream_response(self, query: str, retrieved_docs: List[Dict[str, Any]]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Generate a response as a stream of (event, data) pairs
+        
+        Events, in order: "sources" (evidence, sent before the LLM is called),
+        zero or more "token" ({"text": ...}) and finally either "done"
+        ({"confidence", "usage", "cached"}) or "error" ({"detail"}).
+        
+        Args:
+            query: User query
+            retrieved_docs: List of retrieved documents
+        """
+        context_docs = self.pack_context(retrieved_docs)
+        if not context_docs:
+            yield "sources", {"sources": []}
+            yield "token", {"text": NO_CONTEXT_RESPONSE}
+            yield "done", {"confidence": "low", "usage": None, "cached": False}
+            return
+        
+        prompt, sources = self._build_prompt(query, context_docs)
+        yield "sources", {"sources": sources}
+        
+        cache_key, cached = await self._acache_lookup(query, context_docs)
+        if cached is not None:
+            yield "token", {"text": cached["response"]}
+            yield "done", {"confidence": cached["confidence"], "usage": None, "cached": True}
+            return
+        
+        self._log_request(query, context_docs, prompt)
+        
+        start_time = datetime.now()
+        first_token_time = None
+        parts = []
+        usage = None
+        
+        try:
+            async with self.llm_client.stream(self._request_payload(prompt, stream=True)) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode('utf-8', errors='replace')
+                    logger.error(f"❌ OpenRouter Error: {response.status_code} {body[:200]}")
+                    yield "error", {"detail": f"Error generating response: {response.status_code}"}
+                    return
+                
+                async for line in response.aiter_lines():
+                    chunk = self._parse_stream_line(line)
+                    if chunk is None:
+                        continue
+                    if chunk.get("done"):
+                        break
+                    if "error" in chunk:
+                        logger.error(f"❌ OpenRouter stream error: {chunk['error']}")
+                        yield "error", {"detail": f"Error generating response: {chunk['error'].get('message', chunk['error'])}"}
+                        return
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    
+                    choices = chunk.get("choices") or [{}]
+                    text = (choices[0].get("delta") or {}).get("content")
+                    if text:
+                        if first_token_time is None:
+                            first_token_time = (datetime.now() - start_time).total_seconds()
+                        parts.append(text)
+                        yield "token", {"text": text}
+        
+        except httpx.TimeoutException:
+            logger.error(f"❌ OpenRouter Timeout during stream")
+            yield "error", {"detail": "Error: Request timed out. Please try again."}
+            return
         except Exception as e:
-            logger.error(f"❌ OpenRouter Exception:")
-            logger.error(f"   Error: {str(e)}")
+            logger.error(f"❌ OpenRouter Exception: {str(e)}")
             logger.exception("Full traceback:")
-            return {
-                "response": f"Error calling LLM: {str(e)}",
-                "sources": sources,
-                "confidence": "error"
-            }
+            yield "error", {"detail": f"Error calling LLM: {str(e)}"}
+            return
+        
+        elapsed = (datetime.now() - start_time).total_seconds()
+        answer = "".join(parts)
+        confidence = self._confidence(retrieved_docs)
+        
+        logger.info(f"✅ OpenRouter stream complete:")
+        logger.info(f"   Time to first token: {first_token_time if first_token_time is not None else 'N/A'}s")
+        logger.info(f"   Total time: {elapsed:.2f}s")
+        logger.info(f"   Response length: {len(answer)} chars")
+        
+        await self._acache_store(cache_key, {
+            "response": answer,
+            "sources": sources,
+            "confidence": confidence
+        })
+        
+        yield "done", {"confidence": confidence, "usage": usage, "cached": False}
+    
+    def warmup(self, queries: List[str], clear_query_cache: bool = True):
+        """
+        Exercise the embedding model and every loaded index before serving
+        
+        Each query is retrieved across all domains, encoded once more as a
+        batch (bypassing the cache), then run as a batch against every
+        domain with each result packed into a context, so lazy
+        initialization (model graph, thread pools, mmap'd index pages) is
+        paid before the first real request.
+        
+        Args:
+            queries: Representative user queries
+            clear_query_cache: Drop the warmup entries from the query
+                embedding cache afterwards. A fork shares the cache with the
+                serving pipeline, so reloads pass False to keep it intact.
+        """
+        if not queries:
+            return
+        
+        start_time = datetime.now()
+        # Cold-start batches would inflate the rerank time estimate
+        rerank_estimate = self.reranker.batch_seconds if self.reranker is not None else None
+        for query in queries:
+            self.retrieve(query)
+        self._encode_texts(queries)
+        for domain in self.indexes:
+            for docs in self.retrieve_many(queries, domain):
+                self.pack_context(docs)
+        if clear_query_cache:
+            self.query_cache.clear()
+        if rerank_estimate is not None:
+            self.reranker.reset_timing(rerank_estimate)
+        
+        elapsed = (datetime.now() - start_time).total_seconds()
+        print(f"Warmup: {len(queries)} queries over {len(self.indexes)} domains in {elapsed:.2f}s")
     
     def query(self, query_text: str, domain: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -341,18 +1658,21 @@ if __name__ == "__main__":
     # Test RAG pipeline
     from data_ingestion import DataIngestion
     
-    # Load or create documents
     ingestion = DataIngestion()
+    rag = RAGPipeline()
     
-    if os.path.exists("indexes/all_documents.pkl"):
-        all_docs = ingestion.load_documents()
+    if "--stream" in sys.argv:
+        # Parse, embed and index in one bounded-memory pass (no all_documents.pkl)
+        rag.build_all_indexes_stream(ingestion)
     else:
-        all_docs = ingestion.ingest_all_domains()
-        ingestion.save_documents()
-    
-    # Build RAG pipeline
-    rag = RAGPipeline()
-    rag.build_all_indexes(all_docs)
+        # Load or create documents
+        if os.path.exists("indexes/all_documents.pkl"):
+            all_docs = ingestion.load_documents()
+        else:
+            all_docs = ingestion.ingest_all_domains()
+            ingestion.save_documents()
+        
+        rag.build_all_indexes(all_docs, ingestion.source_hashes)
     rag.save_indexes()
     
     # Test query
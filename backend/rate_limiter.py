@@ -0,0 +1,36 @@
+"""
+Thread-safe token bucket for client-side API rate limiting
+"""
+import time
+import threading
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average with bursts up to `capacity`
+
+    acquire() blocks until a token is available, so any number of worker
+    threads can share one bucket to stay under a provider's rate limit.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available (no-op if rate <= 0)"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
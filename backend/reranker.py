@@ -0,0 +1,150 @@
+"""
+Latency-budgeted cross-encoder reranking of retrieved candidates
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple
+
+from sentence_transformers import CrossEncoder
+
+from query_cache import normalize_query, chunk_key
+
+
+class Reranker:
+    """
+    Reorders FAISS candidates with a CPU cross-encoder within a time budget
+
+    Candidates are scored in FAISS order, one batch of (query, chunk) pairs at
+    a time. The first batch is always scored; before each later one the
+    reranker checks that the batch is expected to finish inside the budget;
+    if not it stops, reranks only the scored prefix and leaves the remaining
+    candidates in FAISS order. Scores are cached per (query, chunk) so
+    repeated questions cost nothing.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 16, budget_ms: float = 150.0,
+                 cache_size: int = 10000):
+        self.model = CrossEncoder(model_name)
+        self.batch_size = max(1, batch_size)
+        self.budget = budget_ms / 1000.0
+        self.cache_size = cache_size
+
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Moving average of seconds per batch, used to predict the next batch
+        self._batch_seconds = 0.0
+
+        # Metrics
+        self.calls = 0
+        self.budget_exhausted = 0
+        self.pairs_scored = 0
+        self.cache_hits = 0
+
+    def _cache_get(self, key: Tuple[str, str]):
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _cache_put(self, key: Tuple[str, str], score: float):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query: str, docs: List[Dict[str, Any]], top_n: int) -> List[Dict[str, Any]]:
+        """
+        Rerank candidates and return the best top_n
+
+        Args:
+            query: User query
+            docs: Retrieved candidates in FAISS order
+            top_n: Number of documents to keep
+
+        Returns:
+            Documents in reranked order; scored ones carry "rerank_score"
+        """
+        start = time.perf_counter()
+        normalized = normalize_query(query)
+        keys = [(normalized, chunk_key(doc)) for doc in docs]
+
+        scores = [self._cache_get(key) for key in keys]
+        cached = sum(score is not None for score in scores)
+
+        pending = [i for i, score in enumerate(scores) if score is None]
+        exhausted = False
+        for batch_start in range(0, len(pending), self.batch_size):
+            elapsed = time.perf_counter() - start
+            # The first batch always runs: skipping it would leave the estimate
+            # stuck after one slow batch and disable reranking for good
+            if batch_start > 0 and elapsed + self._batch_seconds > self.budget:
+                exhausted = True
+                break
+
+            batch = pending[batch_start:batch_start + self.batch_size]
+            batch_begin = time.perf_counter()
+            batch_scores = self.model.predict(
+                [(query, docs[i]["text"]) for i in batch],
+                batch_size=self.batch_size,
+                show_progress_bar=False
+            )
+            batch_time = time.perf_counter() - batch_begin
+            with self._lock:
+                self._batch_seconds = batch_time if not self._batch_seconds else 0.8 * self._batch_seconds + 0.2 * batch_time
+                self.pairs_scored += len(batch)
+
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+                self._cache_put(keys[i], float(score))
+
+        with self._lock:
+            self.calls += 1
+            self.cache_hits += cached
+            if exhausted:
+                self.budget_exhausted += 1
+
+        # Rerank the contiguous scored prefix; the tail keeps FAISS order
+        prefix = 0
+        while prefix < len(docs) and scores[prefix] is not None:
+            prefix += 1
+
+        head = []
+        for i in range(prefix):
+            doc = docs[i].copy()
+            doc["rerank_score"] = scores[i]
+            head.append(doc)
+        head.sort(key=lambda doc: doc["rerank_score"], reverse=True)
+
+        return (head + list(docs[prefix:]))[:top_n]
+
+    @property
+    def batch_seconds(self) -> float:
+        """Current per-batch time estimate"""
+        return self._batch_seconds
+
+    def reset_timing(self, batch_seconds: float = 0.0):
+        """Replace the per-batch estimate, e.g. to discard timings taken during warmup"""
+        self._batch_seconds = batch_seconds
+
+    def clear_cache(self):
+        """Drop cached scores (e.g. after the indexes change)"""
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Reranker metrics for the health endpoint"""
+        with self._lock:
+            return {
+                "budget_ms": self.budget * 1000.0,
+                "calls": self.calls,
+                "budget_exhausted": self.budget_exhausted,
+                "pairs_scored": self.pairs_scored,
+                "cache_hits": self.cache_hits,
+                "cache_size": len(self._cache),
+                "avg_batch_ms": round(self._batch_seconds * 1000.0, 3)
+            }
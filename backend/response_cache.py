@@ -0,0 +1,185 @@
+"""
+Cache of generated answers keyed by query, retrieved evidence and model/prompt version
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+from query_cache import normalize_query, chunk_key
+
+
+def make_response_key(query: str, docs: List[Dict[str, Any]], model: str, prompt_version: str) -> str:
+    """
+    Hash of everything that determines an answer
+
+    Args:
+        query: User query (normalized before hashing)
+        docs: The chunks passed to the LLM as context, in prompt order (their
+            identity and their text as sent)
+        model: LLM model name
+        prompt_version: Version of the prompt template
+    """
+    payload = json.dumps({
+        "query": normalize_query(query),
+        "chunks": [chunk_key(doc) for doc in docs],
+        "texts": [hashlib.sha1(doc["text"].encode('utf-8')).hexdigest() for doc in docs],
+        "model": model,
+        "prompt_version": prompt_version
+    })
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Base class: TTL + size-bounded store of response dicts with hit/miss counters"""
+
+    backend = "none"
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 86400):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached response, or None if missing or expired"""
+        value = self._get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store a response, evicting the least recently used entries if full"""
+        if self.max_size > 0:
+            self._put(key, value)
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _put(self, key: str, value: Dict[str, Any]):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate counters for the health endpoint"""
+        size = len(self)
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.backend,
+                "size": size,
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class MemoryResponseCache(ResponseCache):
+    """In-process LRU with per-entry expiry"""
+
+    backend = "memory"
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 86400):
+        super().__init__(max_size, ttl_seconds)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return json.loads(value)
+
+    def _put(self, key: str, value: Dict[str, Any]):
+        # Stored serialized so callers cannot mutate the cached copy
+        serialized = json.dumps(value)
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, serialized)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """On-disk cache that survives restarts and can be shared by workers on one host"""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, max_size: int = 1000, ttl_seconds: float = 86400):
+        super().__init__(max_size, ttl_seconds)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, expires FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def _put(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now)
+            )
+            self._conn.execute("DELETE FROM responses WHERE expires < ?", (now,))
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_size:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                    (count - self.max_size,)
+                )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def create_response_cache(backend: str, max_size: int, ttl_seconds: float,
+                          path: Optional[str] = None) -> ResponseCache:
+    """Build the configured response cache backend ("memory" or "sqlite")"""
+    if backend == "sqlite":
+        return SQLiteResponseCache(path, max_size, ttl_seconds)
+    if backend == "memory":
+        return MemoryResponseCache(max_size, ttl_seconds)
+    raise ValueError(f"Unknown response cache backend '{backend}'. Valid backends: ['memory', 'sqlite']")
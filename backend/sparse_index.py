@@ -0,0 +1,195 @@
+"""
+In-process BM25 inverted index for exact-term lookups (NCT IDs, drug names,
+trial phases) that dense MiniLM embeddings retrieve poorly
+"""
+import os
+import re
+import json
+from collections import Counter
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the
+this to was were what which with how does do did can
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word/identifier tokens; keeps NCT04280705, covid-19, 2.5mg intact"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class SparseIndex:
+    """
+    BM25 index stored as CSR postings lists
+
+    Each term's postings hold doc ids (ascending) and the precomputed BM25
+    impact of the term in that doc, so a query score is a sum of impacts.
+    Search uses MaxScore pruning: terms are processed by decreasing maximum
+    impact, and once the remaining terms cannot lift a new doc past the
+    current k-th best score, they are only applied to existing candidates.
+    """
+
+    def __init__(self, vocab: Dict[str, int], term_offsets: np.ndarray, postings_docs: np.ndarray,
+                 postings_impacts: np.ndarray, max_impacts: np.ndarray, num_docs: int):
+        self.vocab = vocab
+        self.term_offsets = term_offsets
+        self.postings_docs = postings_docs
+        self.postings_impacts = postings_impacts
+        self.max_impacts = max_impacts
+        self.num_docs = num_docs
+
+    @classmethod
+    def build(cls, texts: List[str], k1: float = 1.2, b: float = 0.75) -> "SparseIndex":
+        """Build the index from chunk texts (doc id = position in texts)"""
+        doc_terms = [Counter(tokenize(text)) for text in texts]
+        doc_lengths = np.array([sum(tf.values()) for tf in doc_terms], dtype='float32')
+        avg_length = float(doc_lengths.mean()) if len(texts) else 0.0
+        if avg_length <= 0:
+            avg_length = 1.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, tf in enumerate(doc_terms):
+            for term, count in tf.items():
+                postings.setdefault(term, []).append((doc_id, count))
+
+        vocab = {term: i for i, term in enumerate(sorted(postings))}
+        term_offsets = np.zeros(len(vocab) + 1, dtype='int64')
+        docs_parts, impact_parts = [], []
+        max_impacts = np.zeros(len(vocab), dtype='float32')
+        num_docs = len(texts)
+
+        for term, term_id in vocab.items():
+            entries = postings[term]
+            doc_ids = np.array([d for d, _ in entries], dtype='int32')
+            tfs = np.array([c for _, c in entries], dtype='float32')
+            df = len(entries)
+            idf = np.log(1.0 + (num_docs - df + 0.5) / (df + 0.5))
+            norm = k1 * (1.0 - b + b * doc_lengths[doc_ids] / avg_length)
+            impacts = (idf * tfs * (k1 + 1.0) / (tfs + norm)).astype('float32')
+
+            docs_parts.append(doc_ids)
+            impact_parts.append(impacts)
+            term_offsets[term_id + 1] = term_offsets[term_id] + df
+            max_impacts[term_id] = impacts.max()
+
+        return cls(
+            vocab,
+            term_offsets,
+            np.concatenate(docs_parts) if docs_parts else np.zeros(0, dtype='int32'),
+            np.concatenate(impact_parts) if impact_parts else np.zeros(0, dtype='float32'),
+            max_impacts,
+            num_docs
+        )
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """
+        Top-k BM25 matches for a query
+
+        Returns:
+            List of (doc_id, score) in descending score order
+        """
+        term_ids = sorted(
+            {self.vocab[t] for t in tokenize(query) if t in self.vocab},
+            key=lambda t: -self.max_impacts[t]
+        )
+        if not term_ids or k <= 0:
+            return []
+
+        # Upper bound on what the not-yet-processed terms can still add
+        remaining = np.cumsum([self.max_impacts[t] for t in term_ids][::-1])[::-1]
+
+        cand_ids = np.zeros(0, dtype='int32')
+        cand_scores = np.zeros(0, dtype='float32')
+
+        for pos, term_id in enumerate(term_ids):
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = np.asarray(self.postings_docs[start:end])
+            impacts = np.asarray(self.postings_impacts[start:end])
+
+            threshold = np.partition(cand_scores, -k)[-k] if len(cand_scores) >= k else 0.0
+            if len(cand_scores) >= k and remaining[pos] <= threshold:
+                # Non-essential term: only existing candidates can still benefit
+                loc = np.searchsorted(docs, cand_ids)
+                loc[loc >= len(docs)] = 0
+                hit = docs[loc] == cand_ids
+                cand_scores[hit] += impacts[loc[hit]]
+                continue
+
+            merged_ids = np.concatenate([cand_ids, docs])
+            merged_scores = np.concatenate([cand_scores, impacts])
+            cand_ids, inverse = np.unique(merged_ids, return_inverse=True)
+            cand_scores = np.bincount(inverse, weights=merged_scores).astype('float32')
+
+        top = np.argsort(-cand_scores)[:k]
+        return [(int(cand_ids[i]), float(cand_scores[i])) for i in top if cand_scores[i] > 0]
+
+    def save(self, directory: str):
+        """Write postings as .npy files (memory-mappable) plus a JSON vocab"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "term_offsets.npy"), self.term_offsets)
+        np.save(os.path.join(directory, "postings_docs.npy"), self.postings_docs)
+        np.save(os.path.join(directory, "postings_impacts.npy"), self.postings_impacts)
+        np.save(os.path.join(directory, "max_impacts.npy"), self.max_impacts)
+        with open(os.path.join(directory, "vocab.json"), 'w') as f:
+            json.dump({"num_docs": self.num_docs, "vocab": self.vocab}, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> Optional["SparseIndex"]:
+        """Load a saved index, or None if it has not been built"""
+        vocab_path = os.path.join(directory, "vocab.json")
+        if not os.path.exists(vocab_path):
+            return None
+        mmap_mode = 'r' if mmap else None
+
+        def load(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        with open(vocab_path) as f:
+            meta = json.load(f)
+        return cls(
+            meta["vocab"],
+            load("term_offsets"),
+            load("postings_docs"),
+            load("postings_impacts"),
+            np.load(os.path.join(directory, "max_impacts.npy")),
+            meta["num_docs"]
+        )
+
+
+def fuse_rankings(dense: List[Tuple[str, int, float]], sparse: List[Tuple[str, int, float]],
+                  method: str = "rrf", rrf_k: int = 60,
+                  dense_weight: float = 0.5) -> List[Tuple[Tuple[str, int], float]]:
+    """
+    Combine a dense and a sparse ranking of (domain, doc_id, score) hits
+
+    Args:
+        method: "rrf" (reciprocal rank fusion) or "weighted" (dense cosine
+            blended with max-normalized BM25)
+        rrf_k: RRF rank offset
+        dense_weight: Weight of the dense score for "weighted" fusion
+
+    Returns:
+        List of ((domain, doc_id), fused_score) in descending fused order
+    """
+    fused: Dict[Tuple[str, int], float] = {}
+
+    if method == "weighted":
+        top_sparse = max((score for _, _, score in sparse), default=0.0)
+        for domain, doc_id, score in dense:
+            fused[(domain, doc_id)] = fused.get((domain, doc_id), 0.0) + dense_weight * score
+        for domain, doc_id, score in sparse:
+            normalized = score / top_sparse if top_sparse > 0 else 0.0
+            fused[(domain, doc_id)] = fused.get((domain, doc_id), 0.0) + (1.0 - dense_weight) * normalized
+    elif method == "rrf":
+        for ranking in (dense, sparse):
+            for rank, (domain, doc_id, _) in enumerate(ranking):
+                fused[(domain, doc_id)] = fused.get((domain, doc_id), 0.0) + 1.0 / (rrf_k + rank + 1)
+    else:
+        raise ValueError(f"Unknown fusion method '{method}'. Valid methods: ['rrf', 'weighted']")
+
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
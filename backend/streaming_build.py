@@ -0,0 +1,163 @@
+"""
+Streaming index build: parse -> embed -> index with bounded buffers
+
+The parse stage runs in a background thread and hands document batches to
+the embedding stage through a bounded queue, so PDF/CSV I/O overlaps with
+model compute and a slow consumer blocks the producer instead of letting
+parsed documents pile up. Embeddings are computed in fixed-size batches and
+added to the index as they arrive; only the first STREAM_TRAIN_SIZE vectors
+are held at once, and only for index types that need training.
+"""
+import os
+import queue
+import tempfile
+import threading
+from typing import List, Dict, Any, Iterable, Iterator, Optional, TypeVar
+
+import numpy as np
+import faiss
+
+from index_factory import new_index, factory_string, apply_search_params, is_quantized
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+def prefetch(items: Iterable[T], max_pending: int) -> Iterator[T]:
+    """
+    Produce items in a background thread, at most max_pending ahead of the consumer
+
+    Exceptions raised by the producer are re-raised in the consumer. If the
+    consumer stops early the producer is released and exits.
+    """
+    buffer: "queue.Queue" = queue.Queue(maxsize=max(1, max_pending))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+
+    thread = threading.Thread(target=produce, name="stream-producer", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def rebatch(batches: Iterable[List[T]], batch_size: int) -> Iterator[List[T]]:
+    """Regroup variable-size batches into batches of exactly batch_size (last may be short)"""
+    pending: List[T] = []
+    for batch in batches:
+        pending.extend(batch)
+        while len(pending) >= batch_size:
+            yield pending[:batch_size]
+            pending = pending[batch_size:]
+    if pending:
+        yield pending
+
+
+class StreamingIndexBuilder:
+    """
+    Fills a FAISS index from a stream of normalized embedding batches
+
+    Indexes that need training (IVF, SQ8, PQ) buffer the first train_size
+    vectors, train on them and flush them; all other batches go straight
+    into the index. For quantized storage the full-precision vectors needed
+    for re-scoring are appended to a scratch file in vectors_dir rather than
+    kept in memory.
+    """
+
+    def __init__(self, dimension: int, index_config: Dict[str, Any], train_size: int,
+                 vectors_dir: Optional[str] = None):
+        self.dimension = dimension
+        self.index_config = index_config
+        self.train_size = max(1, train_size)
+        self.index: Optional[faiss.Index] = None
+        self._pending: List[np.ndarray] = []
+        self._pending_rows = 0
+        self.ntotal = 0
+
+        probe = faiss.index_factory(dimension, factory_string(index_config), faiss.METRIC_INNER_PRODUCT)
+        if probe.is_trained:
+            # Flat and HNSW without quantizer training: nothing to buffer
+            self.index = new_index(np.empty((0, dimension), dtype='float32'), index_config)
+
+        self._vectors_file = None
+        if is_quantized(index_config):
+            self._vectors_file = tempfile.NamedTemporaryFile(
+                dir=vectors_dir, prefix="stream-", suffix=".f32", delete=False
+            )
+
+    def add(self, embeddings: np.ndarray):
+        if self._vectors_file is not None:
+            self._vectors_file.write(np.ascontiguousarray(embeddings, dtype='float32').tobytes())
+        self.ntotal += len(embeddings)
+
+        if self.index is not None:
+            self.index.add(embeddings)
+            return
+        self._pending.append(embeddings)
+        self._pending_rows += len(embeddings)
+        if self._pending_rows >= self.train_size:
+            self._flush()
+
+    def _flush(self):
+        sample = np.vstack(self._pending)
+        self._pending = []
+        self._pending_rows = 0
+        self.index = new_index(sample, self.index_config)
+        self.index.add(sample)
+
+    def finish(self) -> Optional[faiss.Index]:
+        """Complete index with search parameters applied, or None if nothing was added"""
+        if self.index is None and self._pending:
+            self._flush()
+        if self.index is not None:
+            apply_search_params(self.index, self.index_config)
+        return self.index
+
+    def vectors(self) -> Optional[np.ndarray]:
+        """Full-precision vectors (read-only memmap) for quantized storage"""
+        if self._vectors_file is None or self.ntotal == 0:
+            return None
+        self._vectors_file.close()
+        path = self._vectors_file.name
+        vectors = np.memmap(path, dtype='float32', mode='r', shape=(self.ntotal, self.dimension))
+        try:
+            # The mapping stays valid; the file disappears once it is released
+            os.unlink(path)
+        except OSError:
+            pass
+        return vectors
+
+    def close(self):
+        """Remove the scratch vectors file unless vectors() has taken it over (safe to repeat)"""
+        if self._vectors_file is not None and not self._vectors_file.closed:
+            self._vectors_file.close()
+            try:
+                os.unlink(self._vectors_file.name)
+            except OSError:
+                pass
@@ -0,0 +1,153 @@
+"""
+Incrementally update the domain indexes from the data folders
+
+Usage:
+    python update_index.py                      # sync every domain
+    python update_index.py covid diabetes       # sync some domains
+    python update_index.py --delete covid/File.pdf
+
+Each source file (PDF or CSV) is fingerprinted by content hash. Only new or
+changed files are parsed, only chunks whose text changed are embedded, and
+files that disappeared are removed from the index. The result is saved as a
+new index version; a running API picks it up with POST /admin/reload.
+"""
+import os
+import sys
+import json
+import pickle
+from typing import List, Dict, Any, Optional
+
+from config import DOMAINS, INDEX_DIR, MERGED_INDEX_ENABLED
+from data_ingestion import DataIngestion, file_hash, sources_path
+from rag_pipeline import RAGPipeline
+
+DOCUMENTS_PATH = os.path.join(INDEX_DIR, "all_documents.pkl")
+
+
+def sync_domain(pipeline: RAGPipeline, ingestion: DataIngestion, domain: str,
+                delete_sources: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Bring one domain's index in line with its source files
+
+    Args:
+        pipeline: Pipeline with indexes loaded writable (mmap=False)
+        ingestion: Parser for source files
+        domain: Clinical domain identifier
+        delete_sources: Remove only these sources instead of syncing the folder
+
+    Returns:
+        Summary with the changed sources and update_index counts
+    """
+    known = pipeline.source_hashes.setdefault(domain, {})
+    indexed = set(doc["source"] for doc in pipeline.metadata.get(domain, []))
+
+    upserts = {}
+    deletes = []
+    summary = {"new": [], "changed": [], "deleted": [], "failed": []}
+
+    if delete_sources is not None:
+        deletes = [source for source in delete_sources if source in indexed]
+    else:
+        on_disk = ingestion.list_sources(domain)
+
+        for source, path in on_disk.items():
+            digest = file_hash(path)
+            if known.get(source) == digest:
+                continue
+            if source not in known and source in indexed:
+                # Indexed before hashes were tracked: assume it is current
+                known[source] = digest
+                continue
+
+            print(f"  {'Updating' if source in indexed else 'Adding'}: {source}...")
+            try:
+                documents = ingestion.process_source(domain, path)
+            except Exception as e:
+                print(f"    Error processing {source}: {str(e)}")
+                summary["failed"].append(source)
+                continue
+            if not documents:
+                # Keep the indexed version rather than wiping it on a parse failure
+                print(f"    No chunks extracted from {source}, keeping the indexed version")
+                summary["failed"].append(source)
+                continue
+
+            upserts[source] = documents
+            known[source] = digest
+            summary["changed" if source in indexed else "new"].append(source)
+
+        deletes = sorted(indexed - set(on_disk))
+
+    for source in deletes:
+        known.pop(source, None)
+    summary["deleted"] = deletes
+
+    if upserts or deletes:
+        summary.update(pipeline.update_index(domain, upserts, deletes))
+    return summary
+
+
+def update_documents_file(pipeline: RAGPipeline):
+    """Keep all_documents.pkl (input of a full rebuild) in step with the indexes"""
+    if not os.path.exists(DOCUMENTS_PATH):
+        return
+    with open(DOCUMENTS_PATH, 'rb') as f:
+        all_docs = pickle.load(f)
+    for domain in DOMAINS:
+        if domain in pipeline.metadata:
+            all_docs[domain] = list(pipeline.metadata[domain])
+        else:
+            all_docs.pop(domain, None)
+    with open(DOCUMENTS_PATH, 'wb') as f:
+        pickle.dump(all_docs, f)
+    with open(sources_path(DOCUMENTS_PATH), 'w') as f:
+        json.dump(pipeline.source_hashes, f, indent=1, sort_keys=True)
+    print(f"Updated {DOCUMENTS_PATH}")
+
+
+def save_updates(pipeline: RAGPipeline) -> str:
+    """Rebuild the merged index if enabled and save a new index version"""
+    if MERGED_INDEX_ENABLED:
+        pipeline.build_merged_index()
+    version = pipeline.save_indexes()
+    update_documents_file(pipeline)
+    return version
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    deletions: Dict[str, List[str]] = {}
+    if "--delete" in args:
+        pos = args.index("--delete")
+        for item in args[pos + 1:]:
+            domain, _, source = item.partition("/")
+            deletions.setdefault(domain, []).append(source)
+        args = args[:pos]
+
+    domains = list(deletions) or args or list(DOMAINS)
+    unknown = [d for d in domains if d not in DOMAINS]
+    if unknown:
+        print(f"Unknown domains: {unknown}. Valid domains: {list(DOMAINS.keys())}")
+        sys.exit(1)
+
+    pipeline = RAGPipeline()
+    pipeline.load_indexes(mmap=False)
+    ingestion = DataIngestion()
+
+    changed = False
+    for domain in domains:
+        print(f"\n{'='*60}")
+        print(f"Updating index for: {DOMAINS[domain]['name']}")
+        print(f"{'='*60}")
+        summary = sync_domain(pipeline, ingestion, domain, deletions.get(domain))
+        print(f"  New: {len(summary['new'])}, changed: {len(summary['changed'])}, "
+              f"deleted: {len(summary['deleted'])}, failed: {len(summary['failed'])}")
+        changed = changed or bool(summary["new"] or summary["changed"] or summary["deleted"])
+
+    if not changed:
+        print("\nIndexes are up to date")
+        sys.exit(0)
+
+    version = save_updates(pipeline)
+    print(f"\nSaved index version {version}")
+    print("Run POST /admin/reload to serve it without a restart")
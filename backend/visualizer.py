@@ -240,6 +240,22 @@ class Visualizer:
         return self._fig_to_base64(fig)
 
 
+_worker_visualizer = None
+
+
+def render_visualization(documents: List[Dict[str, Any]], viz_type: str = "wordcloud") -> str:
+    """
+    Render a visualization with this process's Visualizer
+
+    Module-level so it can be submitted to a process pool; each worker
+    creates its Visualizer once and reuses it.
+    """
+    global _worker_visualizer
+    if _worker_visualizer is None:
+        _worker_visualizer = Visualizer()
+    return _worker_visualizer.generate_combined_visualization(documents, viz_type)
+
+
 if __name__ == "__main__":
     # Test visualization
     test_docs = [
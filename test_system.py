@@ -140,11 +140,20 @@ def test_indexes():
     print("\nTesting indexes...")
     
     from config import DOMAINS
+    from index_versions import resolve_version, domain_paths
     import os
     
     indexes_exist = False
     
-    for domain_id, domain_config in DOMAINS.items():
+    try:
+        version, index_dir = resolve_version()
+        print(f"  Active index version: {version}")
+    except ValueError as e:
+        print(f"  ⚠ {e}")
+        return True
+    
+    for domain_id in DOMAINS:
+        domain_config = domain_paths(domain_id, index_dir)
         index_path = domain_config['index_path']
         metadata_path = domain_config['metadata_path']
         